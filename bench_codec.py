@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+import numpy as np
+from dx_codec import ChunkDecoder, available_codecs, encode
+from wet_bulb import pressurefromelev
+
+# Compression ratio and throughput of the PutNDArray/GetNDArray wire
+# encodings on synthetic fields shaped like the CMIP6 GDDP grid.
+
+def _smooth_field(rng, shape, scale):
+    lat = np.linspace(-np.pi/2, np.pi/2, shape[-2])[:, None]
+    lon = np.linspace(-np.pi, np.pi, shape[-1])[None, :]
+    base = np.cos(lat) * scale + 0.1 * scale * np.sin(3*lon) * np.cos(2*lat)
+    return(base + rng.normal(0, 0.01 * scale, shape))
+
+def make_fields(days):
+    rng = np.random.default_rng(0)
+    elev = np.clip(_smooth_field(rng, (600, 1440), 2000.0) - 800.0, 0, None)
+    fields = {}
+    fields['pressure (f8)'] = pressurefromelev(elev)
+    fields['tas (f4)'] = (250.0 + _smooth_field(rng, (days, 600, 1440), 40.0)).astype(np.float32)
+    fields['huss (f4)'] = np.abs(_smooth_field(rng, (days, 600, 1440), 0.02)).astype(np.float32)
+    return(fields)
+
+def bench(arr, encoding, keepbits):
+    t0 = time.perf_counter()
+    data = encode(arr, encoding, keepbits=keepbits)
+    t1 = time.perf_counter()
+    out = np.empty_like(arr)
+    decoder = ChunkDecoder(encoding, arr.itemsize, memoryview(out.reshape(-1)).cast('B'))
+    decoder.feed(data)
+    decoder.finish()
+    t2 = time.perf_counter()
+    mb = arr.nbytes / 2**20
+    err = float(np.max(np.abs(out - arr))) if keepbits is not None else 0.0
+    return({'ratio': arr.nbytes / len(data), 'encode_MBps': mb / (t1-t0),
+            'decode_MBps': mb / (t2-t1), 'max_abs_err': err})
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--days', type=int, default=4)
+    ap.add_argument('--keepbits', type=int, nargs='*', default=[16, 10],
+                    help='lossy mantissa bits to try in addition to lossless')
+    ap.add_argument('--json', help='write results to this file')
+    opts = ap.parse_args()
+
+    results = []
+    fields = make_fields(opts.days)
+    for codec in available_codecs():
+        for encoding in (codec, codec + '+shuffle'):
+            for keepbits in [None] + opts.keepbits:
+                for name, arr in fields.items():
+                    r = bench(arr, encoding, keepbits)
+                    r.update({'field': name, 'encoding': encoding, 'keepbits': keepbits, 'MB': arr.nbytes / 2**20})
+                    results.append(r)
+                    print(f"{name:14s} {encoding:14s} keepbits={str(keepbits):5s} ratio={r['ratio']:6.2f} "
+                          f"enc={r['encode_MBps']:8.1f} MB/s dec={r['decode_MBps']:8.1f} MB/s err={r['max_abs_err']:.3g}")
+    if not results:
+        print('no codecs available; install zstandard and/or lz4.')
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(results, f, indent=1)
@@ -0,0 +1,164 @@
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dx_data_api import DXDataAPI, ExecArg
+from dx_mock_server import DXMockServer
+from wet_bulb import WetBulbArrays
+
+# Benchmarks GetNDArray, PutNDArray, Exec and WetBulbArrays against a
+# DXMockServer, so no remote deployment is needed. The server runs in this
+# process and each case runs in a fresh child process, so peak_rss_MB is the
+# client's own high-water mark for that case alone. Results can be written
+# as JSON and compared against an earlier run with --compare.
+
+def _peak_rss_mb():
+    # VmHWM belongs to the current address space, so it starts afresh in each
+    # case's child process; ru_maxrss is carried over from the parent across
+    # fork and exec on Linux, which would count the server's memory too.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return(int(line.split()[1]) / 2**10)
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return(rss / 2**20 if sys.platform == 'darwin' else rss / 2**10)
+
+def _summarize(name, params, latencies, wall, nbytes, cells):
+    lat = np.array(latencies) * 1000.0
+    return({'case': name, **params, 'n': len(latencies),
+            'p50_ms': float(np.percentile(lat, 50)), 'p90_ms': float(np.percentile(lat, 90)),
+            'p99_ms': float(np.percentile(lat, 99)), 'MBps': nbytes / 2**20 / wall,
+            'cells_per_s': cells / wall, 'peak_rss_MB': _peak_rss_mb()})
+
+def _timed_calls(fn, count, concurrency):
+    latencies = []
+    def one(i):
+        t0 = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(count)))
+    return(latencies, time.perf_counter() - t0)
+
+def bench_get(api, side, days, dtype, concurrency, count):
+    version = (12000 << 16) | (days - 1)
+    def call(i):
+        lb = (i % 8, i % 16)
+        api.GetNDArray('v:tas,m:bench', version, lb, (lb[0] + side - 1, lb[1] + side - 1), nspace = 'cmip6-planetary')
+    latencies, wall = _timed_calls(call, count, concurrency)
+    cells = count * days * side * side
+    return(_summarize('get', {'side': side, 'days': days, 'dtype': np.dtype(dtype).name, 'concurrency': concurrency},
+                      latencies, wall, cells * np.dtype(dtype).itemsize, cells))
+
+def bench_put(api, side, dtype, concurrency, count):
+    arr = np.random.default_rng(0).random((side, side)).astype(dtype)
+    def call(i):
+        api.PutNDArray(arr, f'v:bench{i % 4},m:mymodel', 0, (0, 0))
+    latencies, wall = _timed_calls(call, count, concurrency)
+    return(_summarize('put', {'side': side, 'dtype': np.dtype(dtype).name, 'concurrency': concurrency},
+                      latencies, wall, count * arr.nbytes, count * arr.size))
+
+def bench_exec(api, side, days, concurrency, count):
+    version = (12000 << 16) | (days - 1)
+    def mean_fn(t):
+        return(t.mean(axis=0))
+    arg = [ExecArg('v:tas,m:bench', version, (0, 0), (side - 1, side - 1), 'cmip6-planetary')]
+    latencies, wall = _timed_calls(lambda i: api.Exec(arg, mean_fn), count, concurrency)
+    cells = count * days * side * side
+    return(_summarize('exec', {'side': side, 'days': days, 'concurrency': concurrency},
+                      latencies, wall, cells * 4, cells))
+
+def bench_wetbulb(side, days, count):
+    rng = np.random.default_rng(0)
+    t = rng.uniform(230, 320, (days, side, side))
+    h = rng.uniform(0, 0.03, (days, side, side))
+    p = rng.uniform(50000, 104000, (side, side))
+    latencies, wall = _timed_calls(lambda i: WetBulbArrays(t, p, h), count, 1)
+    return(_summarize('wetbulb', {'side': side, 'days': days}, latencies, wall,
+                      count * (t.nbytes + h.nbytes + p.nbytes), count * t.size))
+
+def compare(results, baseline, tolerance):
+    # A case regresses when its median latency grew by more than tolerance.
+    def key(r):
+        return(tuple(sorted((k, v) for k, v in r.items() if not isinstance(v, float) and k != 'n')))
+    base = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = base.get(key(r))
+        if b and r['p50_ms'] > b['p50_ms'] * (1 + tolerance):
+            regressions.append((key(r), b['p50_ms'], r['p50_ms']))
+    return(regressions)
+
+def run_case(case, socket, opts):
+    # Runs one case in a fresh interpreter and returns its result.
+    spec = json.dumps({'socket': socket, 'days': opts.days, 'count': opts.count, **case})
+    out = subprocess.run([sys.executable, __file__, '--case', spec], capture_output=True, text=True, check=True)
+    return(json.loads(out.stdout))
+
+def _child(spec):
+    spec = json.loads(spec)
+    case, days, count = spec['case'], spec['days'], spec['count']
+    if case == 'wetbulb':
+        return(bench_wetbulb(spec['side'], days, count))
+    with DXDataAPI(spec['socket'], pool_maxsize=spec['concurrency']) as api:
+        if case == 'get':
+            return(bench_get(api, spec['side'], days, np.dtype(spec['dtype']), spec['concurrency'], count))
+        if case == 'put':
+            return(bench_put(api, spec['side'], np.dtype(spec['dtype']), spec['concurrency'], count))
+        return(bench_exec(api, spec['side'], days, spec['concurrency'], count))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sides', type=int, nargs='*', default=[32, 128, 512])
+    ap.add_argument('--days', type=int, default=4)
+    ap.add_argument('--concurrency', type=int, nargs='*', default=[1, 4, 16])
+    ap.add_argument('--count', type=int, default=32)
+    ap.add_argument('--json', help='write results to this file')
+    ap.add_argument('--compare', help='earlier results file to check for regressions')
+    ap.add_argument('--tolerance', type=float, default=0.25)
+    ap.add_argument('--case', help=argparse.SUPPRESS)
+    opts = ap.parse_args()
+    if opts.case:
+        print(json.dumps(_child(opts.case)))
+        sys.exit(0)
+
+    results = []
+    for dtype in (np.float32, np.float64):
+        with DXMockServer(synth_dtype=dtype) as server:
+            name = np.dtype(dtype).name
+            for side in opts.sides:
+                for c in opts.concurrency:
+                    results.append(run_case({'case': 'get', 'side': side, 'dtype': name, 'concurrency': c}, server.socket, opts))
+                    results.append(run_case({'case': 'put', 'side': side, 'dtype': name, 'concurrency': c}, server.socket, opts))
+                    if dtype == np.float32:
+                        results.append(run_case({'case': 'exec', 'side': side, 'concurrency': c}, server.socket, opts))
+    for side in opts.sides:
+        opts_wb = argparse.Namespace(days=opts.days, count=max(1, opts.count // 8))
+        results.append(run_case({'case': 'wetbulb', 'side': side}, None, opts_wb))
+
+    for r in results:
+        params = ' '.join(f'{k}={r[k]}' for k in ('side', 'days', 'dtype', 'concurrency') if k in r)
+        print(f"{r['case']:8s} {params:45s} p50={r['p50_ms']:8.2f}ms p99={r['p99_ms']:8.2f}ms "
+              f"{r['MBps']:8.1f} MB/s {r['cells_per_s']:12.0f} cells/s rss={r['peak_rss_MB']:.0f}MB")
+    output = {'meta': {'python': platform.python_version(), 'numpy': np.__version__,
+                       'platform': platform.platform(), 'time': time.time()},
+              'results': results}
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(output, f, indent=1)
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(results, json.load(f), opts.tolerance)
+        for key, before, after in regressions:
+            print(f'REGRESSION {dict(key)}: p50 {before:.2f}ms -> {after:.2f}ms')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,88 @@
+import argparse
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+# Measures how long `import dx_interface` takes in a fresh interpreter, which
+# is what short-lived CLI and serverless invocations pay on every run, and
+# checks that the optional heavy dependencies are still imported lazily.
+# Results can be written as JSON and compared against an earlier run with
+# --compare.
+
+# Modules a plain query does not need; importing any of them eagerly fails
+# the benchmark.
+_LAZY = ['scipy', 'netCDF4', 'bitstring', 'dateutil', 'dill', 'asyncio', 'multiprocessing.shared_memory']
+
+def _run(code):
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return(out)
+
+def time_import(module, repeat):
+    code = f'import time; t0 = time.perf_counter(); import {module}; print(time.perf_counter() - t0)'
+    times = [float(_run(code).stdout) * 1000.0 for _ in range(repeat)]
+    return(statistics.median(times), min(times))
+
+def eager_modules(module):
+    code = (f'import sys, json; import {module}; '
+            f'print(json.dumps([m for m in {_LAZY!r} if m in sys.modules]))')
+    return(json.loads(_run(code).stdout))
+
+def top_imports(module, count):
+    # Largest self times reported by -X importtime, in milliseconds.
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (.*)', line)
+        if m:
+            rows.append((int(m.group(1)) / 1000.0, int(m.group(2)) / 1000.0, m.group(3).strip()))
+    return(sorted(rows, reverse=True)[:count])
+
+def compare(results, baseline, tolerance):
+    # A module regresses when its median import time grew by more than tolerance.
+    base = {r['module']: r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        b = base.get(r['module'])
+        if b and r['median_ms'] > b['median_ms'] * (1 + tolerance):
+            regressions.append((r['module'], b['median_ms'], r['median_ms']))
+    return(regressions)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--modules', nargs='*', default=['dx_interface'])
+    ap.add_argument('--repeat', type=int, default=10)
+    ap.add_argument('--top', type=int, default=10, help='show this many slowest imports')
+    ap.add_argument('--json', help='write results to this file')
+    ap.add_argument('--compare', help='earlier results file to check for regressions')
+    ap.add_argument('--tolerance', type=float, default=0.25)
+    opts = ap.parse_args()
+
+    results = []
+    failed = False
+    for module in opts.modules:
+        median, best = time_import(module, opts.repeat)
+        eager = eager_modules(module)
+        results.append({'module': module, 'median_ms': median, 'min_ms': best, 'eager': eager})
+        print(f'{module:20s} median={median:8.1f}ms min={best:8.1f}ms')
+        for self_ms, total_ms, name in top_imports(module, opts.top):
+            print(f'    {self_ms:8.1f}ms self {total_ms:8.1f}ms total  {name}')
+        if eager:
+            print(f'EAGER IMPORT {module}: {", ".join(eager)}')
+            failed = True
+    output = {'meta': {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time()},
+              'results': results}
+    if opts.json:
+        with open(opts.json, 'w') as f:
+            json.dump(output, f, indent=1)
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(results, json.load(f), opts.tolerance)
+        for module, before, after in regressions:
+            print(f'REGRESSION {module}: import {before:.1f}ms -> {after:.1f}ms')
+        failed = failed or bool(regressions)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,51 @@
+import threading
+import time
+import pytest
+from dx_mock_server import DXMockServer
+
+# Two days from day 12000 of the cmip6-planetary namespace, which
+# DXMockServer synthesizes without any data being written.
+_VERSION = (12000 << 16) | 1
+
+def _get(api, i = 0):
+    return(api.GetNDArray('v:tas,m:x', _VERSION, (i, 0), (i + 3, 3), nspace = 'cmip6-planetary'))
+
+class _InFlight:
+    # Wraps a blocking call and records the most calls running at once. The
+    # first calls are made slowest so they finish out of order.
+    def __init__(self, fn, count):
+        self.fn = fn
+        self.count = count
+        self.lock = threading.Lock()
+        self.running = self.peak = self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            delay = 0.01 * (self.count - self.calls)
+            self.calls += 1
+        try:
+            time.sleep(delay)
+            return(self.fn(*args, **kwargs))
+        finally:
+            with self.lock:
+                self.running -= 1
+
+@pytest.fixture
+def version():
+    return(_VERSION)
+
+@pytest.fixture
+def get():
+    # Reads a 4x4 box (shape (2, 4, 4)) starting at row i.
+    return(_get)
+
+@pytest.fixture
+def in_flight():
+    return(_InFlight)
+
+@pytest.fixture
+def server():
+    with DXMockServer() as server:
+        yield server
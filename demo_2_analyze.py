@@ -1,7 +1,6 @@
 from dx_interface import DXInterface
-from wet_bulb import pressurefromelev
+from wet_bulb import pressurefromelev, regridder
 import netCDF4 as nc
-from scipy.interpolate import RegularGridInterpolator
 import numpy as np
 
 # Generate elevation-dependent atmospheric pressure
@@ -11,9 +10,8 @@ lat_cur=np.linspace(-90,90,721); #because elev data file is 721x1440
 lon_cur=np.linspace(-180,180,1440);
 lat_des=np.linspace(-90,90,600)
 lon_des=np.linspace(-180,180,1440);
-interp = RegularGridInterpolator((lat_cur, lon_cur), z_orig,bounds_error=False,fill_value=None);
-X,Y = np.meshgrid(lat_des,lon_des,indexing='ij')
-z_interp=interp((X,Y))
+regrid = regridder(lat_cur, lon_cur, lat_des, lon_des, cache_dir = '.regrid'); #weights are reused across runs
+z_interp=regrid(z_orig, dtype = np.float32)
 psfc_chunk=pressurefromelev(z_interp[:,:]);
 pressure = psfc_chunk
 
@@ -0,0 +1,178 @@
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class DXChunkCache:
+    # Persistent cache of query results for immutable sources. Entries are
+    # .npy files keyed on (name, version, lb, ub) and evicted least recently
+    # used first once the total size exceeds max_bytes. Hits are memory
+    # mapped copy-on-write, so callers may modify them without touching disk.
+    #
+    # Several processes may share a directory. The index is only written by
+    # put(), clear() and flush(), under a lock file, after merging in what
+    # other processes wrote; access times from hits are batched in memory and
+    # written at most every flush_interval seconds. (Without fcntl, e.g. on
+    # Windows, the lock file does not exclude other processes.)
+    def __init__(self, path, max_bytes = 10 * 2**30, flush_interval = 60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._index_path = os.path.join(path, 'index.json')
+        self._lock_path = os.path.join(path, 'index.lock')
+        self._entries = {}
+        # Changes not yet written to the index.
+        self._added = set()
+        self._removed = set()
+        self._touched = {}
+        self._index_mtime = None
+        self._flushed = time.monotonic()
+        with self._lock, self._file_lock():
+            self._merge()
+
+    @staticmethod
+    def _key(name, version, lb, ub):
+        raw = json.dumps([name, int(version), [int(x) for x in lb], [int(x) for x in ub]])
+        return(hashlib.sha1(raw.encode()).hexdigest())
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _stat_index(self):
+        try:
+            return(os.stat(self._index_path).st_mtime_ns)
+        except FileNotFoundError:
+            return(None)
+
+    def _merge(self):
+        # Reloads the index from disk and applies this process's pending
+        # changes on top. Entries another process evicted are dropped here
+        # without touching their files.
+        self._index_mtime = self._stat_index()
+        try:
+            with open(self._index_path) as f:
+                entries = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            entries = {}
+        for key in self._removed:
+            entries.pop(key, None)
+        for key in self._added:
+            entries[key] = self._entries[key]
+        for key, atime in self._touched.items():
+            if key in entries:
+                entries[key]['atime'] = max(entries[key]['atime'], atime)
+        self._entries = entries
+
+    def _commit(self):
+        # Caller holds self._lock.
+        with self._file_lock():
+            self._merge()
+            self._evict()
+            tmp = self._index_path + f'.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp, self._index_path)
+            self._index_mtime = self._stat_index()
+        self._added.clear()
+        self._removed.clear()
+        self._touched.clear()
+        self._flushed = time.monotonic()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._added.discard(key)
+        self._touched.pop(key, None)
+        self._removed.add(key)
+        try:
+            os.remove(os.path.join(self.path, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def _find(self, name, version, lb, ub):
+        key = self._key(name, version, lb, ub)
+        if key in self._entries:
+            return(key)
+        # Otherwise look for a cached superset of the requested box.
+        for k, entry in self._entries.items():
+            if entry['name'] != name or entry['version'] != version or len(entry['lb']) != len(lb):
+                continue
+            if all(el <= l and u <= eu for el,eu,l,u in zip(entry['lb'], entry['ub'], lb, ub)):
+                return(k)
+        return(None)
+
+    def get(self, name, version, lb, ub):
+        with self._lock:
+            key = self._find(name, version, lb, ub)
+            if key is None and self._stat_index() != self._index_mtime:
+                # Another process may have added it.
+                with self._file_lock():
+                    self._merge()
+                key = self._find(name, version, lb, ub)
+            if key is None:
+                return(None)
+            entry = self._entries[key]
+            try:
+                arr = np.load(os.path.join(self.path, entry['file']), mmap_mode='c')
+            except (FileNotFoundError, ValueError):
+                self._drop(key)
+                return(None)
+            entry['atime'] = self._touched[key] = time.time()
+            if time.monotonic() - self._flushed > self.flush_interval:
+                self._commit()
+        # The box covers the trailing dimensions; any leading ones (time) are
+        # kept whole.
+        idx = tuple(slice(l-el, u-el+1) for el,l,u in zip(entry['lb'], lb, ub))
+        return(arr[(Ellipsis,) + idx])
+
+    def put(self, name, version, lb, ub, arr):
+        if arr.nbytes > self.max_bytes:
+            return
+        key = self._key(name, version, lb, ub)
+        fname = key + '.npy'
+        tmp = os.path.join(self.path, fname + f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, os.path.join(self.path, fname))
+        with self._lock:
+            self._entries[key] = {'file': fname, 'name': name, 'version': int(version),
+                                  'lb': [int(x) for x in lb], 'ub': [int(x) for x in ub],
+                                  'nbytes': int(arr.nbytes), 'atime': time.time()}
+            self._added.add(key)
+            self._removed.discard(key)
+            self._commit()
+
+    def _evict(self):
+        total = sum(e['nbytes'] for e in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]['atime']):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key]['nbytes']
+            self._drop(key)
+
+    def flush(self):
+        # Writes batched access times (and any dropped entries) now.
+        with self._lock:
+            if self._touched or self._removed:
+                self._commit()
+
+    def clear(self):
+        with self._lock:
+            with self._file_lock():
+                self._merge()
+                for key in list(self._entries):
+                    self._drop(key)
+            self._commit()
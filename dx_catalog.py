@@ -0,0 +1,147 @@
+import threading
+import time
+import numpy as np
+
+# Variable names follow _build_var_name in dx_interface, e.g.
+# 'v:tas,m:ACCESS-ESM1-5,s:ssp585,q:high'.
+_FIELDS = {'v': 'variable', 'm': 'model', 's': 'scenario', 'q': 'quality'}
+
+def parse_var_name(name):
+    # Returns the variable/model/scenario/quality fields of a name, or None
+    # for names that do not follow the convention.
+    fields = {}
+    for part in name.split(','):
+        key, sep, value = part.partition(':')
+        if not sep or key not in _FIELDS:
+            return(None)
+        fields[_FIELDS[key]] = value
+    return(fields if 'variable' in fields else None)
+
+def _box_covered(lb, ub, boxes):
+    # True when the union of boxes contains lb..ub (inclusive). The pieces
+    # are clipped to the query and coordinate-compressed, so the check only
+    # marks one cell per distinct piece edge rather than per grid point.
+    lb = np.asarray(lb)
+    ub = np.asarray(ub)
+    pieces = []
+    for blb, bub in boxes:
+        if len(blb) != len(lb):
+            continue
+        lo = np.maximum(lb, blb)
+        hi = np.minimum(ub, bub)
+        if np.all(lo <= hi):
+            pieces.append((lo, hi + 1))
+    if not pieces:
+        return(False)
+    edges = [np.unique(np.concatenate([[lb[d], ub[d] + 1]] + [[lo[d], hi[d]] for lo, hi in pieces]))
+             for d in range(len(lb))]
+    covered = np.zeros([len(e) - 1 for e in edges], dtype=bool)
+    for lo, hi in pieces:
+        covered[tuple(slice(np.searchsorted(e, l), np.searchsorted(e, h)) for e, l, h in zip(edges, lo, hi))] = True
+    return(bool(covered.all()))
+
+class DXCatalog:
+    # Client-side copy of the server's GetVars/GetVarObjs listings. Entries
+    # are refreshed once older than ttl seconds with a conditional request,
+    # so an unchanged listing costs a 304 and no transfer. Object listings
+    # are loaded per name on first use. Objects served by a namespace (such
+    # as cmip6-planetary) are not listed by the server and are not checked.
+    def __init__(self, api, ttl = 300):
+        self.api = api
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._names = None
+        self._names_etag = None
+        self._names_time = 0.0
+        self._index = {}
+        self._objs = {}
+
+    def _stale(self, fetched):
+        return(self.ttl is not None and time.monotonic() - fetched > self.ttl)
+
+    def refresh(self, force = False):
+        with self._lock:
+            if self._names is not None and not force and not self._stale(self._names_time):
+                return
+            modified, names, etag = self.api._get_listing('dspaces/var/', None if force else self._names_etag)
+            self._names_time = time.monotonic()
+            if not modified:
+                return
+            names = set(names or [])
+            # Drop object listings of names that disappeared; the others are
+            # refreshed on their own schedule.
+            for name in list(self._objs):
+                if name not in names:
+                    del self._objs[name]
+            self._names = names
+            self._names_etag = etag
+            self._index = {}
+            for name in names:
+                fields = parse_var_name(name)
+                for field, value in (fields or {}).items():
+                    self._index.setdefault(field, {}).setdefault(value, set()).add(name)
+
+    def invalidate(self, name = None):
+        # Forces a refresh on next use, e.g. after this client wrote name.
+        with self._lock:
+            self._names_time = float('-inf')
+            if name is None:
+                self._objs.clear()
+            else:
+                self._objs.pop(name, None)
+
+    def names(self):
+        self.refresh()
+        return(sorted(self._names))
+
+    def has(self, name):
+        self.refresh()
+        return(name in self._names)
+
+    def find(self, variable = None, model = None, scenario = None, quality = None):
+        self.refresh()
+        names = set(self._names)
+        for field, value in (('variable', variable), ('model', model), ('scenario', scenario), ('quality', quality)):
+            if value is not None:
+                names &= self._index.get(field, {}).get(value, set())
+        return(sorted(names))
+
+    def values(self, field, **filters):
+        # Distinct values of one field among the names matching filters,
+        # e.g. values('model', variable = 'tas').
+        return(sorted(set(f[field] for f in map(parse_var_name, self.find(**filters)) if field in f)))
+
+    def objects(self, name):
+        if not self.has(name):
+            return([])
+        with self._lock:
+            entry = self._objs.get(name)
+            if entry is not None and not self._stale(entry[2]):
+                return(entry[0])
+            modified, objs, etag = self.api._get_listing(f'dspaces/var/{name}/', entry[1] if entry else None)
+            if not modified:
+                objs = entry[0]
+                etag = entry[1]
+            self._objs[name] = (objs or [], etag, time.monotonic())
+            return(self._objs[name][0])
+
+    def versions(self, name):
+        return(sorted(set(o['version'] for o in self.objects(name))))
+
+    def covers(self, name, version, lb, ub, namespace = None):
+        boxes = [(o['lb'], o['ub']) for o in self.objects(name)
+                 if o['version'] == version and o.get('namespace') == namespace]
+        return(_box_covered(lb, ub, boxes))
+
+    def validate(self, args):
+        # Raises ValueError for the first ExecArg that names an unknown
+        # variable or a box the listed objects do not cover.
+        for arg in args:
+            if arg.namespace:
+                continue
+            if not self.has(arg.name):
+                raise ValueError(f'unknown variable {arg.name}.')
+            if not self.covers(arg.name, arg.version, arg.lb, arg.ub):
+                versions = self.versions(arg.name)
+                raise ValueError(f'{arg.name} version {arg.version} does not cover {tuple(arg.lb)}-{tuple(arg.ub)} '
+                                 f'(known versions {versions}).')
@@ -0,0 +1,132 @@
+import struct
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Wire format: a sequence of frames, each an 8-byte raw length and an 8-byte
+# compressed length (little endian) followed by the compressed bytes. Frames
+# are compressed independently so both sides only ever hold one chunk.
+_FRAME_HEADER = struct.Struct('<QQ')
+
+def available_codecs():
+    codecs = []
+    if zstandard is not None:
+        codecs.append('zstd')
+    if lz4_frame is not None:
+        codecs.append('lz4')
+    return(codecs)
+
+def parse_encoding(encoding):
+    parts = encoding.split('+')
+    codec = parts[0]
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError('zstd compression requires the zstandard package.')
+    if codec == 'lz4' and lz4_frame is None:
+        raise ImportError('lz4 compression requires the lz4 package.')
+    if codec not in ('zstd', 'lz4'):
+        raise ValueError(f'unknown encoding {encoding}.')
+    return(codec, 'shuffle' in parts[1:])
+
+def _compressor(codec, level):
+    if codec == 'zstd':
+        return(zstandard.ZstdCompressor(level=level if level is not None else 3).compress)
+    return(lambda b: lz4_frame.compress(b, compression_level=level if level is not None else 0))
+
+def _decompressor(codec):
+    if codec == 'zstd':
+        return(zstandard.ZstdDecompressor().decompress)
+    return(lz4_frame.decompress)
+
+def shuffle_bytes(raw, itemsize):
+    # Group byte k of every element together; exponents and high mantissa
+    # bytes of smooth fields then form long, compressible runs.
+    if itemsize == 1:
+        return(bytes(raw))
+    return(np.frombuffer(raw, dtype=np.uint8).reshape(-1, itemsize).T.tobytes())
+
+def unshuffle_bytes(data, itemsize, out):
+    if itemsize == 1:
+        out[:] = data
+        return
+    src = np.frombuffer(data, dtype=np.uint8).reshape(itemsize, -1)
+    np.frombuffer(out, dtype=np.uint8).reshape(-1, itemsize)[...] = src.T
+
+def round_mantissa(arr, keepbits):
+    # Lossy bit rounding (round to nearest, ties to even) that keeps only the
+    # leading keepbits mantissa bits; the zeroed tail compresses to nothing.
+    if arr.dtype == np.float32:
+        utype, mbits = np.uint32, 23
+    elif arr.dtype == np.float64:
+        utype, mbits = np.uint64, 52
+    else:
+        raise TypeError(f'mantissa rounding needs float32 or float64 data, got {arr.dtype}.')
+    if keepbits >= mbits:
+        return(arr)
+    drop = utype(mbits - keepbits)
+    one = utype(1)
+    u = arr.view(utype).copy()
+    half = (one << (drop - one)) - one
+    u += half + ((u >> drop) & one)
+    u &= ~((one << drop) - one)
+    return(u.view(arr.dtype))
+
+def encode_chunks(arr, encoding, chunk_bytes = 2**22, keepbits = None, level = None):
+    codec, shuffle = parse_encoding(encoding)
+    compress = _compressor(codec, level)
+    flat = np.ascontiguousarray(arr).reshape(-1)
+    step = max(1, chunk_bytes // flat.itemsize)
+    for start in range(0, flat.size, step):
+        chunk = flat[start:start+step]
+        if keepbits is not None:
+            chunk = round_mantissa(chunk, keepbits)
+        raw = memoryview(chunk).cast('B')
+        if shuffle:
+            raw = shuffle_bytes(raw, flat.itemsize)
+        comp = compress(raw)
+        yield(_FRAME_HEADER.pack(len(raw), len(comp)) + comp)
+
+def encode(arr, encoding, chunk_bytes = 2**22, keepbits = None, level = None):
+    return(b''.join(encode_chunks(arr, encoding, chunk_bytes, keepbits, level)))
+
+class ChunkDecoder:
+    # Incrementally decodes framed data into a writable byte view, so a
+    # response body can be fed in as it arrives.
+    def __init__(self, encoding, itemsize, out):
+        codec, self.shuffle = parse_encoding(encoding)
+        self.decompress = _decompressor(codec)
+        self.itemsize = itemsize
+        self.out = out
+        self.pos = 0
+        self._pending = bytearray()
+
+    def feed(self, data):
+        self._pending += data
+        while len(self._pending) >= _FRAME_HEADER.size:
+            raw_len, comp_len = _FRAME_HEADER.unpack_from(self._pending)
+            end = _FRAME_HEADER.size + comp_len
+            if len(self._pending) < end:
+                break
+            if self.pos + raw_len > len(self.out):
+                raise RuntimeError(f'encoded data exceeds the expected {len(self.out)} bytes.')
+            raw = self.decompress(bytes(self._pending[_FRAME_HEADER.size:end]))
+            if len(raw) != raw_len:
+                raise RuntimeError('corrupt frame in encoded data.')
+            dest = self.out[self.pos:self.pos+raw_len]
+            if self.shuffle:
+                unshuffle_bytes(raw, self.itemsize, dest)
+            else:
+                dest[:] = raw
+            self.pos += raw_len
+            del self._pending[:end]
+
+    def finish(self):
+        if self._pending or self.pos != len(self.out):
+            raise RuntimeError(f'decoded {self.pos} bytes, expected {len(self.out)}.')
@@ -1,8 +1,26 @@
+import builtins
+import functools
+import hashlib
+import itertools
 import json
+import os
+import random
+import tempfile
+import threading
+import time
+import types
+import uuid
+import weakref
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from dataclasses import dataclass
+from urllib.parse import quote
 import numpy as np
 import requests
-import dill
+from requests.adapters import HTTPAdapter
+from dx_codec import ChunkDecoder, encode_chunks, parse_encoding
+from dx_endpoints import DXEndpointPool
+from dx_metrics import DXCallRecord
 
 @dataclass
 class ExecArg:
@@ -33,61 +51,481 @@ def shape_to_box(shape, offset):
         box['bounds'].append({'start': o, 'span':s})
     return(box)
 
+def _split_box(lb, ub, max_cells):
+    # Split [lb, ub] into tiles of at most max_cells cells. Leading dimensions
+    # are split first so each tile stays contiguous along the trailing ones.
+    spans = [(u-l)+1 for l,u in zip(lb,ub)]
+    chunk = list(spans)
+    for d in range(len(spans)):
+        rest = int(np.prod(spans[d+1:], dtype=np.int64))
+        if max_cells // rest >= 1:
+            chunk[d] = min(spans[d], max_cells // rest)
+            break
+        chunk[d] = 1
+    tiles = []
+    for start in itertools.product(*[range(l, u+1, c) for l,u,c in zip(lb,ub,chunk)]):
+        end = tuple(min(s+c-1, u) for s,c,u in zip(start,chunk,ub))
+        tiles.append((tuple(start), end))
+    return(tiles)
+
+# Map the x-ds-tag type numbers back to dtypes; np.sctypeDict only carries
+# these integer keys on older numpy releases.
+_TAG_DTYPES = {np.dtype(t).num: np.dtype(t) for t in set(np.sctypeDict.values())}
+
+def _tag_to_dtype(tag):
+    if tag in _TAG_DTYPES:
+        return(_TAG_DTYPES[tag])
+    return(np.dtype(np.sctypeDict[tag]))
+
+# Responses and transport errors worth retrying for idempotent calls.
+_RETRY_STATUS = frozenset((429, 500, 502, 503, 504))
+_RETRY_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+def _multipart_body(fields, name, chunks, boundary):
+    # multipart/form-data with the given text fields and one file part whose
+    # content is the byte chunks, in the layout requests produces for files.
+    for key, value in fields.items():
+        yield(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    yield(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{name}"\r\n\r\n'.encode())
+    yield from chunks
+    yield(f'\r\n--{boundary}--\r\n'.encode())
+
+class _SizedBody:
+    # Request body of known length; requests sends an iterable with a
+    # __len__ using Content-Length and writes each part as is.
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self._len = sum(len(p) for p in self.parts)
+
+    def __len__(self):
+        return(self._len)
+
+    def __iter__(self):
+        return(iter(self.parts))
+
+def _detach_globals(fn):
+    # Rebuilds fn with bare globals so dill serializes it by value and the
+    # server does not need the defining module to load it. fn must import
+    # what it uses inside its body.
+    return(types.FunctionType(fn.__code__, {'__builtins__': builtins}, fn.__name__, fn.__defaults__, fn.__closure__))
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Default (connect, read) timeouts per call. The read timeout bounds the wait
+# for each piece of the response, so a stalled server fails the read (and it
+# is retried) instead of hanging the caller. Exec runs arbitrary server-side
+# work and is left unbounded, as are uploads.
+_DEFAULT_TIMEOUTS = {'GetNDArray': (10, 120), 'GetVars': (10, 30), 'GetVarObjs': (10, 30), 'GetListing': (10, 30)}
+
+def _instrumented(name):
+    # Wraps a DXDataAPI call so that, when hooks are registered, a
+    # DXCallRecord collects its phases and is passed to every hook. Without
+    # hooks the call runs directly.
+    def wrap(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if not self.hooks:
+                return(fn(self, *args, **kwargs))
+            record = DXCallRecord(name)
+            stack = self._local.__dict__.setdefault('records', [])
+            stack.append(record)
+            try:
+                return(fn(self, *args, **kwargs))
+            except Exception as e:
+                record.error = repr(e)
+                raise
+            finally:
+                stack.pop()
+                record.finish()
+                self._emit(record)
+        return(wrapper)
+    return(wrap)
+
 class DXDataAPI:
-    def __init__(self, socket):
-        self.socket = socket
-    
-    def _req_url(self, url):
-        return(f'http://{self.socket}/{url}')
+    def __init__(self, socket, pool_connections = 4, pool_maxsize = 16, timeout = (10, None), keep_alive = True,
+                 chunk_size = 2**20, mmap_threshold = None, mmap_dir = None, fn_cache_size = 64,
+                 compression = None, keepbits = None, hooks = None, timeouts = None, retries = 2,
+                 backoff = 0.1, backoff_max = 5.0, hedge_percentile = None, hedge_min_delay = 0.01,
+                 policy = 'round-robin', max_failures = 3, eject_seconds = 30.0):
+        # socket is one 'host:port' or a list of replica servers. Reads and
+        # Exec calls are spread over the replicas by policy ('round-robin',
+        # 'least-outstanding', 'consistent-hash' or a custom object, see
+        # dx_endpoints); writes and registrations go to all of them.
+        self.endpoints = DXEndpointPool(socket, policy, max_failures, eject_seconds)
+        self.socket = self.endpoints.endpoints[0].socket
+        pool_connections = max(pool_connections, len(self.endpoints))
+        # timeout is the requests (connect, read) default; timeouts overrides
+        # it per call name, e.g. {'Exec': (10, 600)}, on top of the finite
+        # _DEFAULT_TIMEOUTS for reads.
+        self.timeouts = {**_DEFAULT_TIMEOUTS, **(timeouts or {})}
+        # Idempotent calls (GetNDArray, GetVars, GetVarObjs) are retried on
+        # connection errors, timeouts and 429/5xx up to retries times with
+        # full-jitter exponential backoff. With hedge_percentile set, such a
+        # call also sends a duplicate request once the first has waited
+        # longer than that percentile of recent latencies for the call, and
+        # the first response to arrive wins.
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self._latencies = defaultdict(lambda: deque(maxlen=256))
+        self._hedge_pool = ThreadPoolExecutor(max_workers=pool_maxsize) if hedge_percentile is not None else None
+        self.hooks = list(hooks or [])
+        self._local = threading.local()
+        # Optional wire encoding such as 'zstd+shuffle' or 'lz4'. Uploads are
+        # sent encoded (optionally mantissa-rounded to keepbits), downloads
+        # are encoded only if the server agrees via the x-ds-encoding header.
+        if compression is not None:
+            parse_encoding(compression)
+        self.compression = compression
+        self.keepbits = keepbits
+        # Serialized Exec functions, keyed on the function object, and the
+        # (server, content hash) pairs acknowledged. Both are LRU bounded.
+        # Servers that did not acknowledge a hash are not sent hashes again.
+        self.fn_cache_size = fn_cache_size
+        self._fn_cache = OrderedDict()
+        self._fn_registered = OrderedDict()
+        self._fn_hash_unsupported = set()
+        self._fn_lock = threading.Lock()
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.mmap_threshold = mmap_threshold
+        self.mmap_dir = mmap_dir
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return(self)
 
-    def _put(self, url, data, files):
-        return(requests.put(self._req_url(url), data=data, files=files))
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _emit(self, record):
+        for hook in self.hooks:
+            hook(record)
+
+    def _record(self):
+        stack = getattr(self._local, 'records', None) if self.hooks else None
+        return(stack[-1] if stack else None)
+
+    def _mark(self, phase, **fields):
+        # Ends a timing phase of the current call's record, if one is active.
+        record = self._record()
+        if record is not None:
+            record.mark(phase)
+            for k, v in fields.items():
+                setattr(record, k, v)
+
+    def _req_url(self, url, socket = None):
+        return(f'http://{socket or self.socket}/{url}')
+
+    def _hedge_delay(self, call):
+        if self._hedge_pool is None:
+            return(None)
+        samples = self._latencies[call]
+        if len(samples) < 20:
+            return(None)
+        return(max(self.hedge_min_delay, float(np.percentile(samples, self.hedge_percentile))))
+
+    def _send_hedged(self, call, send):
+        delay = self._hedge_delay(call)
+        if delay is None:
+            return(send())
+        first = self._hedge_pool.submit(send)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return(first.result())
+        futures = [first, self._hedge_pool.submit(send)]
+        error = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for fut in done:
+                futures.remove(fut)
+                try:
+                    response = fut.result()
+                except Exception as e:
+                    error = e
+                    continue
+                # The slower duplicate is closed whenever it arrives.
+                for other in futures:
+                    other.add_done_callback(lambda f: f.exception() is None and f.result().close())
+                record = self._record()
+                if record is not None:
+                    record.hedged = True
+                return(response)
+        raise error
+
+    def _backoff_delay(self, attempt):
+        return(random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt)))
+
+    def _request(self, method, url, call, idempotent = False, consume = None, key = None, endpoint = None, **kwargs):
+        # Single path for every HTTP call. consume, if given, reads the
+        # response inside the retry loop, so a body that fails mid-transfer
+        # is requested again; its result is returned instead of the response.
+        # The endpoint is picked per attempt from key unless one is given;
+        # retries and hedges prefer replicas this call has not tried yet.
+        kwargs.setdefault('timeout', self.timeouts.get(call, self.timeout))
+        tried = []
+        def send():
+            ep = endpoint or self.endpoints.choose(key, tried)
+            tried.append(ep)
+            self.endpoints.start(ep)
+            ok = False
+            try:
+                t0 = time.perf_counter()
+                response = self.session.request(method, self._req_url(url, ep.socket), **kwargs)
+                self._latencies[call].append(time.perf_counter() - t0)
+                ok = response.status_code not in _RETRY_STATUS
+                return(response)
+            finally:
+                self.endpoints.finish(ep, ok)
+        for attempt in itertools.count():
+            retry = idempotent and attempt < self.retries
+            try:
+                response = self._send_hedged(call, send) if idempotent else send()
+                if retry and response.status_code in _RETRY_STATUS:
+                    response.close()
+                else:
+                    if consume is None:
+                        return(response)
+                    with response:
+                        return(consume(response))
+            except _RETRY_ERRORS:
+                if not retry:
+                    raise
+            record = self._record()
+            if record is not None:
+                record.retries += 1
+            time.sleep(self._backoff_delay(attempt))
+
+    def _put(self, url, body, content_type, endpoint = None):
+        return(self._request('PUT', url, 'PutNDArray', endpoint=endpoint, data=body,
+                             headers={'Content-Type': content_type}))
     
-    def _post(self, url, data, files = None):
-        return(requests.post(self._req_url(url), data=data, files=files))
+    def _post(self, url, data, files = None, call = 'Exec', endpoint = None):
+        return(self._request('POST', url, call, endpoint=endpoint, data=data, files=files))
 
-    def _post_json(self, url, json):
-        return(requests.post(self._req_url(url), json=json))
+    def _post_json(self, url, json, stream = False, headers = None, consume = None, key = None):
+        return(self._request('POST', url, 'GetNDArray', idempotent=True, consume=consume, key=key,
+                             json=json, stream=stream, headers=headers))
 
-    def _get(self, url):
-        return(requests.get(self._req_url(url)))
+    def _get(self, url, headers = None, call = 'GetVars'):
+        return(self._request('GET', url, call, idempotent=True, headers=headers))
 
-    def _get_url_content(self, url):
-        response = self._get(url)
+    def _get_url_content(self, url, call = 'GetVars'):
+        response = self._get(url, call = call)
+        self._mark('request', target = url, status = response.status_code, bytes_received = len(response.content))
         if response.status_code == 404:
             return(None)
         if not response.ok:
             raise RuntimeError(f'request to server failed with {response.status_code}.')
-        return(json.loads(response.content))
+        content = json.loads(response.content)
+        self._mark('decode')
+        return(content)
+
+    @_instrumented('GetListing')
+    def _get_listing(self, url, etag = None):
+        # Conditional form of _get_url_content for catalog refreshes. Returns
+        # (modified, content, etag); modified is False when the server
+        # answered 304 for etag, and content is None for a 404.
+        response = self._get(url, headers = {'If-None-Match': etag} if etag else None, call = 'GetListing')
+        self._mark('request', target = url, status = response.status_code, bytes_received = len(response.content))
+        if response.status_code == 304:
+            return(False, None, etag)
+        if response.status_code == 404:
+            return(True, None, None)
+        if not response.ok:
+            raise RuntimeError(f'request to server failed with {response.status_code}.')
+        content = json.loads(response.content)
+        self._mark('decode')
+        return(True, content, response.headers.get('ETag'))
+
+    def _allocate(self, dims, dtype, out = None, mmap_path = None):
+        dtype = np.dtype(dtype)
+        if out is not None:
+            if out.shape != tuple(dims) or out.dtype != dtype:
+                raise ValueError(f'out has shape {out.shape} and dtype {out.dtype}, expected {tuple(dims)} and {dtype}.')
+            if not out.flags.c_contiguous or not out.flags.writeable:
+                raise ValueError('out must be a writeable C-contiguous array.')
+            return(out)
+        nbytes = int(np.prod(dims, dtype=np.int64)) * dtype.itemsize
+        if mmap_path is None and self.mmap_threshold is not None and nbytes >= self.mmap_threshold and nbytes > 0:
+            # Automatic maps are scratch space. On POSIX the file is unlinked
+            # as soon as it is mapped, so the space is freed with the array
+            # (or the process); elsewhere it is removed when the array is.
+            fd, path = tempfile.mkstemp(dir=self.mmap_dir, suffix='.dat')
+            os.close(fd)
+            arr = np.memmap(path, dtype=dtype, mode='w+', shape=tuple(dims))
+            if os.name == 'posix':
+                os.unlink(path)
+            else:
+                weakref.finalize(arr, _remove_file, path)
+            return(arr)
+        if mmap_path is not None:
+            return(np.memmap(mmap_path, dtype=dtype, mode='w+', shape=tuple(dims)))
+        return(np.empty(dims, dtype=dtype))
 
-    def GetNDArray(self, name, version, lb, ub, nspace = None):
+    def _read_into(self, response, arr):
+        view = memoryview(arr.reshape(-1)).cast('B') if arr.size else memoryview(b'')
+        encoding = response.headers.get('x-ds-encoding')
+        if encoding:
+            decoder = ChunkDecoder(encoding, arr.itemsize, view)
+            received = 0
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                decoder.feed(chunk)
+                received += len(chunk)
+            decoder.finish()
+            return(received)
+        pos = 0
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            end = pos + len(chunk)
+            if end > len(view):
+                raise RuntimeError(f'server sent more than the expected {len(view)} bytes.')
+            view[pos:end] = chunk
+            pos = end
+        if pos != len(view):
+            raise RuntimeError(f'server sent {pos} bytes, expected {len(view)}.')
+        return(pos)
+
+    @_instrumented('GetNDArray')
+    def GetNDArray(self, name, version, lb, ub, nspace = None, out = None, mmap_path = None):
         box = _bounds_to_box(lb, ub)
         url = f'/dspaces/obj/{name}/{version}'
         if nspace:
             url = url + f'?namespace={nspace}'
-        response = self._post_json(url, box)
-        if response.status_code == 404:
-            return None
-        if not response.ok:
-            raise RuntimeError(f'request to server failed with {response.status_code}.')
-        dims = tuple([int(x) for x in response.headers['x-ds-dims'].split(',')])
-        tag = int(response.headers['x-ds-tag'])
-        dtype = np.sctypeDict[tag]
-        arr = np.ndarray(dims, dtype=dtype, buffer=response.content)
-        return(arr)
+        headers = {'x-ds-accept-encoding': self.compression} if self.compression else None
+        allocated = []
+        def consume(response):
+            self._mark('request', target = url, status = response.status_code)
+            if response.status_code == 404:
+                return None
+            if not response.ok:
+                raise RuntimeError(f'request to server failed with {response.status_code}.')
+            dims = tuple([int(x) for x in response.headers['x-ds-dims'].split(',')])
+            dtype = _tag_to_dtype(int(response.headers['x-ds-tag']))
+            # The destination exists before the body is read, so the payload
+            # is written straight into it rather than buffered as bytes. A
+            # retried read reuses the buffer of the failed one.
+            if allocated and allocated[0].shape == dims and allocated[0].dtype == dtype:
+                arr = allocated[0]
+            else:
+                arr = self._allocate(dims, dtype, out, mmap_path)
+                allocated[:] = [arr]
+            self._mark('allocate', cells = arr.size)
+            received = self._read_into(response, arr)
+            self._mark('download', bytes_received = received)
+            return(arr)
+        return(self._post_json(url, box, stream = True, headers = headers, consume = consume,
+                               key = (name, version, tuple(lb), tuple(ub))))
 
+    @_instrumented('PutNDArray')
     def PutNDArray(self, arr, name, version, offset, nspace = None):
         box = shape_to_box(arr.shape, offset)
-        data = {'box': json.dumps(box)}
-        files = {'data': arr.tobytes()}
+        fields = {'box': json.dumps(box)}
         url = f'dspaces/obj/{name}/{version}?element_size={arr.itemsize}&element_type={arr.dtype.num}'
+        arr = np.ascontiguousarray(arr)
+        if self.compression:
+            keepbits = self.keepbits if arr.dtype in (np.float32, np.float64) else None
+            url = url + f'&encoding={quote(self.compression)}'
         if nspace:
             url = url + f'&namespace={nspace}'
-        response = self._put(url, data, files)
-        if not response.ok:
-            raise RuntimeError(f'request to server failed with {response.status_code}.')
+        self._mark('encode', target = url, cells = arr.size)
+        # The multipart body is streamed: uncompressed data is sent straight
+        # from the array's buffer with a Content-Length, encoded data frame
+        # by frame with chunked transfer encoding, so neither the payload nor
+        # the encoded form is ever held as a whole.
+        boundary = uuid.uuid4().hex
+        content_type = f'multipart/form-data; boundary={boundary}'
+        # Every replica gets the write so later reads can go to any of them.
+        for endpoint in self.endpoints.endpoints:
+            if self.compression:
+                sent = [0]
+                def frames():
+                    for frame in encode_chunks(arr, self.compression, self.chunk_size, keepbits):
+                        sent[0] += len(frame)
+                        yield(frame)
+                body = _multipart_body(fields, 'data', frames(), boundary)
+            else:
+                sent = [arr.nbytes]
+                body = _SizedBody(_multipart_body(fields, 'data', [memoryview(arr).cast('B')], boundary))
+            response = self._put(url, body, content_type, endpoint = endpoint)
+            self._mark('request', status = response.status_code, bytes_sent = sent[0])
+            if not response.ok:
+                raise RuntimeError(f'request to {endpoint.socket} failed with {response.status_code}.')
     
-    def Exec(self, args, fn):
+    def PutNDArrayChunked(self, arr, name, version, offset, nspace = None, chunk_bytes = 16 * 2**20,
+                          max_workers = 4, retries = 3, backoff = 0.5):
+        # Uploads arr as offset-addressed sub-boxes in parallel. Chunks that
+        # fail are retried on their own; the rest are never resent.
+        max_cells = max(1, chunk_bytes // arr.itemsize)
+        tiles = _split_box((0,) * arr.ndim, tuple(s-1 for s in arr.shape), max_cells)
+        def put(tile):
+            sub = np.ascontiguousarray(arr[tuple(slice(l, u+1) for l,u in zip(*tile))])
+            self.PutNDArray(sub, name, version, tuple(o+l for o,l in zip(offset, tile[0])), nspace)
+        pending = tiles
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for attempt in range(retries + 1):
+                if attempt:
+                    time.sleep(backoff * 2**(attempt-1))
+                futures = {pool.submit(put, tile): tile for tile in pending}
+                failed = []
+                for fut in as_completed(futures):
+                    try:
+                        fut.result()
+                    except (RuntimeError, requests.RequestException) as e:
+                        failed.append(futures[fut])
+                        error = e
+                if not failed:
+                    return
+                pending = failed
+        raise RuntimeError(f'{len(pending)} of {len(tiles)} chunks failed to upload.') from error
+
+    def _fn_payload(self, fn):
+        with self._fn_lock:
+            if fn in self._fn_cache:
+                self._fn_cache.move_to_end(fn)
+                return(self._fn_cache[fn])
+        import dill
+        payload = dill.dumps(fn)
+        entry = (hashlib.sha256(payload).hexdigest(), payload)
+        with self._fn_lock:
+            self._fn_cache[fn] = entry
+            while len(self._fn_cache) > self.fn_cache_size:
+                self._fn_cache.popitem(last=False)
+        return(entry)
+
+    def _mark_registered(self, key, registered):
+        with self._fn_lock:
+            if registered:
+                self._fn_registered[key] = True
+                self._fn_registered.move_to_end(key)
+                while len(self._fn_registered) > self.fn_cache_size:
+                    self._fn_registered.popitem(last=False)
+            else:
+                self._fn_registered.pop(key, None)
+
+    @_instrumented('Exec')
+    def _send_exec(self, args, fn_entry):
         objs = []
         for obj in args:
             box = _bounds_to_box(obj.lb, obj.ub)
@@ -97,32 +535,131 @@ class DXDataAPI:
                 'bounds': box['bounds']})
             if obj.namespace:
                 objs[-1]['namespace'] = obj.namespace
+        digest, payload = fn_entry
         data = {'requests': json.dumps({'requests': objs})}
-        files = {'fn': dill.dumps(fn)}
         url = f'dspaces/exec/'
-        response = self._post(url, data, files)
+        self._mark('encode', target = url, cells = sum(int(np.prod([b['span'] for b in o['bounds']])) for o in objs))
+        # Registrations are per server, so the replica is chosen up front.
+        endpoint = self.endpoints.choose(data['requests'])
+        registered = (endpoint.socket, digest)
+        hash_supported = endpoint.socket not in self._fn_hash_unsupported
+        response = None
+        if hash_supported and registered in self._fn_registered:
+            # Refer to an already registered function by hash only. The server
+            # rejects unknown hashes (412, or 422 when it wants the fn field),
+            # in which case the full function is sent below.
+            response = self._post(url, dict(data, fn_hash=digest), endpoint = endpoint)
+            if response.status_code in (412, 422):
+                self._mark_registered(registered, False)
+                response = None
+        if response is None:
+            if hash_supported:
+                data['fn_hash'] = digest
+            response = self._post(url, data, {'fn': payload}, endpoint = endpoint)
+            self._mark('request', bytes_sent = len(payload))
+            if response.ok:
+                if response.headers.get('x-ds-fn-hash') == digest:
+                    self._mark_registered(registered, True)
+                else:
+                    with self._fn_lock:
+                        self._fn_hash_unsupported.add(endpoint.socket)
+        self._mark('request', status = response.status_code, bytes_received = len(response.content))
         if response.status_code == 404:
             return(None)
         if not response.ok:
             raise RuntimeError(f'request to server failed with {response.status_code}.')
-        return(dill.loads(response.content))
+        import dill
+        result = dill.loads(response.content)
+        self._mark('decode')
+        return(result)
 
+    def Exec(self, args, fn):
+        return(self._send_exec(args, self._fn_payload(fn)))
+
+    def ExecMany(self, arg_lists, fn, max_workers = 4):
+        # Runs fn once per argument list. The function is serialized a single
+        # time and (index, result) pairs are yielded as the calls complete.
+        fn_entry = self._fn_payload(fn)
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {pool.submit(self._send_exec, args, fn_entry): i for i, args in enumerate(arg_lists)}
+            for fut in as_completed(futures):
+                yield(futures[fut], fut.result())
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    @_instrumented('GetVars')
     def GetVars(self):
-        return(self._get_url_content('dspaces/var/'))
+        return(self._get_url_content('dspaces/var/', call = 'GetVars'))
 
+    @_instrumented('GetVarObjs')
     def GetVarObjs(self, name):
-        return(self._get_url_content(f'dspaces/var/{name}/'))
+        return(self._get_url_content(f'dspaces/var/{name}/', call = 'GetVarObjs'))
 
+    @_instrumented('Register')
     def Register(self, type, name, data):
         url = f'dspaces/register/{type}/{name}'
-        response = self._post(url, json.dumps(data))
-        if not response.ok:
-            content = json.loads(response.content)
-            err_msg = content['detail']
-            raise RuntimeError(f'request to server failed with {response.status_code}: {err_msg}.')
-        handle_dict = json.loads(response.content)
+        handle_dict = None
+        for endpoint in self.endpoints.endpoints:
+            response = self._post(url, json.dumps(data), call = 'Register', endpoint = endpoint)
+            self._mark('request', target = url, status = response.status_code)
+            if not response.ok:
+                content = json.loads(response.content)
+                err_msg = content['detail']
+                raise RuntimeError(f'request to server failed with {response.status_code}: {err_msg}.')
+            handle_dict = handle_dict or json.loads(response.content)
         return(DSRegHandle(**handle_dict))  
 
+class AsyncDXDataAPI:
+    # Runs the blocking DXDataAPI calls on a bounded worker pool so that many
+    # requests can be in flight at once over the shared connection pool.
+    def __init__(self, socket = None, concurrency = 8, api = None, **api_kwargs):
+        if api is None:
+            api_kwargs.setdefault('pool_maxsize', concurrency)
+            api = DXDataAPI(socket, **api_kwargs)
+        self.api = api
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+
+    async def _call(self, fn, *args, **kwargs):
+        # asyncio is imported here rather than at module level; any caller
+        # already has it loaded since it is running an event loop.
+        import asyncio
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return(await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs)))
+
+    async def GetNDArray(self, name, version, lb, ub, nspace = None, out = None, mmap_path = None):
+        return(await self._call(self.api.GetNDArray, name, version, lb, ub, nspace = nspace, out = out, mmap_path = mmap_path))
+
+    async def PutNDArray(self, arr, name, version, offset, nspace = None):
+        return(await self._call(self.api.PutNDArray, arr, name, version, offset, nspace = nspace))
+
+    async def Exec(self, args, fn):
+        return(await self._call(self.api.Exec, args, fn))
+
+    async def GetVars(self):
+        return(await self._call(self.api.GetVars))
+
+    async def GetVarObjs(self, name):
+        return(await self._call(self.api.GetVarObjs, name))
+
+    async def Register(self, type, name, data):
+        return(await self._call(self.api.Register, type, name, data))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.api.close()
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *exc):
+        self.close()
+
 if  __name__ == "__main__":
     def test_fn(a, b):
         return(a+b)
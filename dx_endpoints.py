@@ -0,0 +1,104 @@
+import bisect
+import hashlib
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+
+@dataclass
+class DXEndpoint:
+    socket: str
+    outstanding: int = 0
+    failures: int = 0
+    ejected_until: float = 0.0
+    requests: int = 0
+
+def _hash(key):
+    return(int.from_bytes(hashlib.md5(repr(key).encode()).digest()[:8], 'big'))
+
+class RoundRobin:
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, endpoints, key):
+        return(endpoints[next(self._counter) % len(endpoints)])
+
+class LeastOutstanding:
+    # Fewest requests in flight, ties broken by fewest requests overall.
+    def choose(self, endpoints, key):
+        return(min(endpoints, key=lambda e: (e.outstanding, e.requests)))
+
+class ConsistentHash:
+    # Maps a key such as (name, version, lb, ub) to the same endpoint while
+    # the set of healthy endpoints is unchanged, so repeated reads of a box
+    # hit the server that has it cached. Each endpoint owns `replicas`
+    # points on the ring, which keeps the load even and moves only the keys
+    # of an endpoint that is ejected or returns.
+    def __init__(self, replicas = 64):
+        self.replicas = replicas
+        self._rings = {}
+
+    def _ring(self, endpoints):
+        sockets = tuple(e.socket for e in endpoints)
+        ring = self._rings.get(sockets)
+        if ring is None:
+            points = sorted((_hash((s, i)), j) for j, s in enumerate(sockets) for i in range(self.replicas))
+            ring = ([p for p, _ in points], [j for _, j in points])
+            self._rings[sockets] = ring
+        return(ring)
+
+    def choose(self, endpoints, key):
+        if key is None:
+            return(min(endpoints, key=lambda e: (e.outstanding, e.requests)))
+        points, owners = self._ring(endpoints)
+        i = bisect.bisect(points, _hash(key)) % len(points)
+        return(endpoints[owners[i]])
+
+_POLICIES = {'round-robin': RoundRobin, 'least-outstanding': LeastOutstanding, 'consistent-hash': ConsistentHash}
+
+class DXEndpointPool:
+    # The DataSpaces replicas a DXDataAPI talks to. policy is one of the
+    # names in _POLICIES or any object with choose(endpoints, key). After
+    # max_failures consecutive failures an endpoint is ejected for
+    # eject_seconds and then gets traffic again; a success resets its count.
+    # If every endpoint is ejected they are all used rather than none.
+    def __init__(self, sockets, policy = 'round-robin', max_failures = 3, eject_seconds = 30.0):
+        if isinstance(sockets, str):
+            sockets = [sockets]
+        if not sockets:
+            raise ValueError('at least one endpoint is needed.')
+        self.endpoints = [DXEndpoint(s) for s in sockets]
+        self.policy = _POLICIES[policy]() if isinstance(policy, str) else policy
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return(len(self.endpoints))
+
+    def healthy(self):
+        now = time.monotonic()
+        return([e for e in self.endpoints if e.ejected_until <= now] or list(self.endpoints))
+
+    def choose(self, key = None, exclude = ()):
+        # exclude holds endpoints already tried by this call (retries and
+        # hedges), which are skipped while others remain.
+        candidates = self.healthy()
+        others = [e for e in candidates if e not in exclude]
+        with self._lock:
+            return(self.policy.choose(others or candidates, key))
+
+    def start(self, endpoint):
+        with self._lock:
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+
+    def finish(self, endpoint, ok):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
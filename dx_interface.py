@@ -1,23 +1,87 @@
-from dx_data_api import DXDataAPI, ExecArg
-from datetime import date
-from dateutil import parser
-from bitstring import pack
-from scipy.interpolate import RegularGridInterpolator
+import functools
+from collections import deque
+from dx_data_api import DXDataAPI, AsyncDXDataAPI, ExecArg, _split_box
+from dx_catalog import DXCatalog
+from dx_lazy import DXDeferredArray
+from dx_metrics import DXCallRecord
+from dx_output import cast_result, compact
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
 import numpy as np
-import netCDF4 as nc
+
+# Heavier or optional modules (dateutil, dill, netCDF4, asyncio,
+# multiprocessing via dx_local) are imported where they are used, so that a
+# plain query does not pay for them at import time; bench_import.py checks
+# this.
+
+# The planetary-gddp grid: 0.25 degree cells covering 60S-90N, 180W-180E.
+_GRID_SHAPE = (600, 1440)
+
+def discretize_geo(lats, lons):
+    # Vectorized mapping of coordinates to grid indices. Points on the upper
+    # edge (90N, 180E) belong to the last cell.
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if np.any((lats < -60) | (lats > 90)) or np.any((lons < -180) | (lons > 180)):
+        raise ValueError('coordinates must lie within 60S-90N and 180W-180E.')
+    ilat = np.minimum(((lats + 60.0) / 0.25).astype(np.int64), _GRID_SHAPE[0] - 1)
+    ilon = np.minimum(((lons + 180.0) / 0.25).astype(np.int64), _GRID_SHAPE[1] - 1)
+    return(ilat, ilon)
 
 def _discretize_geo(lat, lon):
-    assert lat >= -60 and lat <= 90
-    assert lon >= -180 and lon <= 180 
-    if lat >= 89.875:
-        lat = lat - 0.125
-    if lon >= 179.875:
-        lon = lon - 0.125
-    return (int((lat+60.0)/0.25), int((lon+180.0)/0.25))
+    ilat, ilon = discretize_geo(lat, lon)
+    return (int(ilat), int(ilon))
 
 def reverse_geo(lat, lon):
     return((lat * .25) - 59.875), ((lon * .25) - 179.875)
 
+def grid_coords(lb, ub):
+    # Cell-centre latitude and longitude vectors for an index box.
+    lat = np.arange(lb[0], ub[0]+1) * .25 - 59.875
+    lon = np.arange(lb[1], ub[1]+1) * .25 - 179.875
+    return(lat, lon)
+
+def discretize_boxes(geo_lbs, geo_ubs):
+    geo_lbs = np.asarray(geo_lbs, dtype=np.float64).reshape(-1, 2)
+    geo_ubs = np.asarray(geo_ubs, dtype=np.float64).reshape(-1, 2)
+    lbs = np.stack(discretize_geo(geo_lbs[:, 0], geo_lbs[:, 1]), axis=1)
+    ubs = np.stack(discretize_geo(geo_ubs[:, 0], geo_ubs[:, 1]), axis=1)
+    if np.any(lbs > ubs):
+        raise ValueError('each box needs geo_lb <= geo_ub.')
+    return(lbs, ubs)
+
+def _cover_boxes(lbs, ubs, slack = 0.25):
+    # Greedily merges index boxes whose union costs at most (1 + slack) times
+    # their separate cell counts, which joins overlapping and adjacent boxes
+    # but keeps distant ones apart. Returns the covering boxes and, for each
+    # input box, the index of the cover containing it.
+    lbs = np.array(lbs, dtype=np.int64).reshape(-1, 2)
+    ubs = np.array(ubs, dtype=np.int64).reshape(-1, 2)
+    members = [[i] for i in range(len(lbs))]
+    merged = True
+    while merged and len(lbs) > 1:
+        merged = False
+        cells = np.prod(ubs - lbs + 1, axis=1)
+        for i in range(len(lbs)):
+            ulb = np.minimum(lbs[i], lbs)
+            uub = np.maximum(ubs[i], ubs)
+            ucells = np.prod(uub - ulb + 1, axis=1)
+            ok = ucells <= (cells[i] + cells) * (1 + slack)
+            ok[i] = False
+            if ok.any():
+                j = int(np.argmax(ok))
+                lbs[i], ubs[i] = ulb[j], uub[j]
+                members[i] += members[j]
+                lbs = np.delete(lbs, j, axis=0)
+                ubs = np.delete(ubs, j, axis=0)
+                del members[j]
+                merged = True
+                break
+    owner = np.empty(sum(len(m) for m in members), dtype=np.int64)
+    for k, m in enumerate(members):
+        owner[m] = k
+    return(lbs, ubs, owner)
+
 def _build_var_name(variable, model = None, scenario = None, quality = None):
     var_name = f'v:{variable}'
     if model:
@@ -28,38 +92,336 @@ def _build_var_name(variable, model = None, scenario = None, quality = None):
         var_name = var_name + f',q:{quality}'
     return var_name
 
+_BASE_DATE = date(1950,1,1)
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(value):
+    # ISO dates, the common case, are parsed without dateutil; anything else
+    # falls back to dateutil's parser.
+    if isinstance(value, datetime):
+        return(value.date())
+    if isinstance(value, date):
+        return(value)
+    try:
+        return(date.fromisoformat(value))
+    except ValueError:
+        pass
+    try:
+        return(datetime.fromisoformat(value).date())
+    except ValueError:
+        from dateutil import parser
+        return(parser.parse(value).date())
+
 def _get_version(start_date, end_date):
-    s = parser.parse(start_date).date()
-    e = parser.parse(end_date).date()
+    # Start day since 1950-01-01 in the high 16 bits, span in days in the
+    # low 16 bits.
+    s = _parse_date(start_date)
+    e = _parse_date(end_date)
     assert(e >= s)
-    base_date = date(1950,1,1)
-    start = (s - base_date).days
+    start = (s - _BASE_DATE).days
     span = (e - s).days
-    version = pack('uint:16, uint:16', start, span).uint
-    return(version)
+    if not (0 <= start < 2**16 and span < 2**16):
+        raise ValueError(f'dates {s} to {e} do not fit the 16-bit version fields.')
+    return((start << 16) | span)
+
+def _split_dates(start_date, end_date, days):
+    s = _parse_date(start_date)
+    e = _parse_date(end_date)
+    assert(e >= s)
+    windows = []
+    while s <= e:
+        w_end = min(s + timedelta(days = days - 1), e)
+        windows.append((s.isoformat(), w_end.isoformat()))
+        s = w_end + timedelta(days = 1)
+    return(windows)
 
 class DXInterface:
-    def __init__(self, socket):
-       self.api = DXDataAPI(socket)
+    # Tiles are sized assuming 4-byte cells, which is what the CMIP6 GDDP
+    # variables are stored as.
+    _tile_itemsize = 4
+
+    def __init__(self, socket, tile_bytes = 64 * 2**20, max_workers = 4, cache = None, executor = None,
+                 catalog_ttl = None, **api_kwargs):
+       self.api = DXDataAPI(socket, **api_kwargs)
+       # With catalog_ttl set, exec arguments are checked against a cached
+       # DXCatalog of the server's listings before anything is sent.
+       self.catalog = DXCatalog(self.api, ttl = catalog_ttl) if catalog_ttl is not None else None
+       # exec() runs on the server unless an executor is given; 'local'
+       # selects a DXLocalExecutor over this connection.
+       if executor == 'local':
+           from dx_local import DXLocalExecutor
+           executor = DXLocalExecutor(self.api)
+       self.executor = executor
+       self.tile_bytes = tile_bytes
+       self.max_workers = max_workers
+       # Optional DXChunkCache; only used for the immutable planetary-gddp data.
+       self.cache = cache
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.flush()
+        self.api.close()
 
+    def __enter__(self):
+        return(self)
 
-    def _query_pc(self, variable, start_date, end_date, model = None, scenario = None, quality = None, geo_lb = (-60.0,-180.0), geo_ub = (90.0,180.0)):
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _query_pc(self, variable, start_date, end_date, model = None, scenario = None, quality = None, geo_lb = (-60.0,-180.0), geo_ub = (90.0,180.0), out = None, lazy = False,
+                  dtype = None, scale = None, offset = None):
         lb = _discretize_geo(*geo_lb)
         ub = _discretize_geo(*geo_ub)
         assert lb[0] <= ub[0] and lb[1] <= ub[1]
         var_name = _build_var_name(variable, model, scenario, quality)
-        version = _get_version(start_date, end_date)
-        data = self.api.GetNDArray(var_name, version, lb, ub, nspace = 'cmip6-planetary')
-        lat = [(l * .25) - 59.875 for l in range(lb[0], ub[0]+1)]
-        lon = [(l * .25) - 179.875 for l in range(lb[1], ub[1]+1)]
+        if lazy:
+            return(DXDeferredArray(self, var_name, start_date, end_date, lb, ub))
+        data = self._fetch_compact(var_name, start_date, end_date, lb, ub, out, dtype, scale, offset)
+        lat, lon = grid_coords(lb, ub)
         return(data, lat, lon)
 
+    def _fetch_compact(self, var_name, start_date, end_date, lb, ub, out = None, dtype = None, scale = None, offset = None):
+        # dtype = 'float32' (or another float) downcasts tile by tile as the
+        # data arrives, so the full result never exists in the wire dtype.
+        # dtype = 'int16' returns a PackedArray, packed from a float32 fetch.
+        if dtype is None or np.dtype(dtype) != np.int16:
+            return(self._fetch_pc(var_name, start_date, end_date, lb, ub, out, dtype))
+        if out is not None:
+            raise ValueError('out is not supported for int16 output.')
+        return(compact(self._fetch_pc(var_name, start_date, end_date, lb, ub, dtype = np.float32),
+                       np.int16, scale, offset))
+
+    def _fetch_pc(self, var_name, start_date, end_date, lb, ub, out = None, dtype = None):
+        data = None
+        if self.cache is not None:
+            cache_name = f'cmip6-planetary/{var_name}'
+            if dtype is not None:
+                cache_name = cache_name + f'@{np.dtype(dtype).name}'
+            version = _get_version(start_date, end_date)
+            data = self.cache.get(cache_name, version, lb, ub)
+            if self.api.hooks:
+                record = DXCallRecord('cache', target = cache_name, cache_hit = data is not None,
+                                      cells = data.size if data is not None else 0)
+                record.finish()
+                self.api._emit(record)
+            if data is not None and out is not None:
+                out[...] = data
+                data = out
+        if data is None:
+            data = self._get_tiled(var_name, start_date, end_date, lb, ub, 'cmip6-planetary', out = out, dtype = dtype)
+            if self.cache is not None and data is not None:
+                self.cache.put(cache_name, version, lb, ub, data)
+        return(data)
+
+    def _plan_tiles(self, start_date, end_date, lb, ub):
+        max_cells = max(1, self.tile_bytes // self._tile_itemsize)
+        day_cells = (ub[0] - lb[0] + 1) * (ub[1] - lb[1] + 1)
+        if day_cells <= max_cells:
+            # Capped at the requested span, since a tiny box would otherwise
+            # ask for a window running past the end of the date range.
+            days = min(max_cells // day_cells, (_parse_date(end_date) - _parse_date(start_date)).days + 1)
+            tiles = [(lb, ub)]
+        else:
+            days = 1
+            tiles = _split_box(lb, ub, max_cells)
+        windows = []
+        for s, e in _split_dates(start_date, end_date, days):
+            ndays = (date.fromisoformat(e) - date.fromisoformat(s)).days + 1
+            windows.append((_get_version(s, e), ndays))
+        return(windows, tiles)
+
+    def _get_tiled(self, var_name, start_date, end_date, lb, ub, nspace, out = None, dtype = None):
+        windows, tiles = self._plan_tiles(start_date, end_date, lb, ub)
+        if len(windows) == 1 and len(tiles) == 1:
+            if dtype is None:
+                return(self.api.GetNDArray(var_name, windows[0][0], lb, ub, nspace = nspace, out = out))
+            data = self.api.GetNDArray(var_name, windows[0][0], lb, ub, nspace = nspace)
+            if data is None or (data.dtype == dtype and out is None):
+                return(data)
+            out = self.api._allocate(data.shape, dtype, out)
+            out[...] = data
+            return(out)
+        # The first tile tells us the result dtype and whether the server adds
+        # a leading time axis (one step per day of the window).
+        first = self.api.GetNDArray(var_name, windows[0][0], tiles[0][0], tiles[0][1], nspace = nspace)
+        if first is None:
+            return(None)
+        spans = tuple((u-l)+1 for l,u in zip(lb,ub))
+        if first.ndim == len(spans) and len(windows) == 1:
+            steps = None
+            shape = spans
+        elif first.ndim == len(spans) + 1:
+            steps = np.cumsum([0] + [days for _, days in windows])
+            shape = (steps[-1],) + spans
+        else:
+            raise RuntimeError(f'unexpected result dimensions {first.shape} for box of {spans}.')
+        wire_dtype = first.dtype
+        out = self.api._allocate(shape, dtype or wire_dtype, out)
+
+        def dest(w, tile):
+            idx = tuple(slice(t0-l, t1-l+1) for t0,t1,l in zip(tile[0], tile[1], lb))
+            if steps is not None:
+                idx = (slice(steps[w], steps[w+1]),) + idx
+            return(out[idx])
+
+        def fetch(w, tile):
+            d = dest(w, tile)
+            version = windows[w][0]
+            # Whole-row tiles map to a contiguous block of the output and are
+            # streamed into it directly; others go through a tile buffer.
+            if d.flags.c_contiguous and d.dtype == wire_dtype:
+                return(self.api.GetNDArray(var_name, version, tile[0], tile[1], nspace = nspace, out = d) is not None)
+            arr = self.api.GetNDArray(var_name, version, tile[0], tile[1], nspace = nspace)
+            if arr is None:
+                return(False)
+            if arr.shape != d.shape:
+                raise RuntimeError(f'tile returned shape {arr.shape}, expected {d.shape}.')
+            d[...] = arr
+            return(True)
+
+        d = dest(0, tiles[0])
+        if first.shape != d.shape:
+            raise RuntimeError(f'tile returned shape {first.shape}, expected {d.shape}.')
+        d[...] = first
+        del first
+        # A missing or failed tile cancels the tiles not yet started, so a
+        # failure does not wait for the rest of the box to download.
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            futures = [pool.submit(fetch, w, tile)
+                        for w in range(len(windows)) for tile in tiles
+                        if (w, tile) != (0, tiles[0])]
+            try:
+                for fut in as_completed(futures):
+                    if not fut.result():
+                        return(None)
+            finally:
+                for f in futures:
+                    f.cancel()
+        return(out)
+
+    def _fetch_boxes(self, var_name, start_date, end_date, lbs, ubs):
+        def fetch(box):
+            lb, ub = tuple(int(x) for x in box[0]), tuple(int(x) for x in box[1])
+            return(self._fetch_pc(var_name, start_date, end_date, lb, ub))
+        with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+            futures = [pool.submit(fetch, box) for box in zip(lbs, ubs)]
+            try:
+                return([f.result() for f in futures])
+            finally:
+                for f in futures:
+                    f.cancel()
+
+    def query_points(self, lats, lons, variable, start_date, end_date, model = None, scenario = None,
+                     quality = None, block = 64):
+        # Values at many points. Points are grouped into block x block cell
+        # tiles, the bounding boxes of the occupied tiles are merged into a
+        # few covering fetches and the values scattered back per point.
+        # Returns the data with points on the last axis and the snapped grid
+        # coordinates of each point.
+        ilat, ilon = discretize_geo(np.ravel(lats), np.ravel(lons))
+        if ilat.size == 0:
+            raise ValueError('query_points needs at least one point.')
+        keys = (ilat // block) * (_GRID_SHAPE[1] // block + 1) + ilon // block
+        _, group = np.unique(keys, return_inverse=True)
+        ngroups = group.max() + 1 if group.size else 0
+        lbs = np.stack([np.full(ngroups, _GRID_SHAPE[0]), np.full(ngroups, _GRID_SHAPE[1])], axis=1)
+        ubs = np.full((ngroups, 2), -1)
+        np.minimum.at(lbs, group, np.stack([ilat, ilon], axis=1))
+        np.maximum.at(ubs, group, np.stack([ilat, ilon], axis=1))
+        lbs, ubs, owner = _cover_boxes(lbs, ubs)
+        var_name = _build_var_name(variable, model, scenario, quality)
+        boxes = self._fetch_boxes(var_name, start_date, end_date, lbs, ubs)
+        if any(b is None for b in boxes):
+            return(None)
+        box_of = owner[group]
+        out = np.empty(boxes[0].shape[:-2] + (ilat.size,), dtype=boxes[0].dtype)
+        for k, data in enumerate(boxes):
+            sel = np.nonzero(box_of == k)[0]
+            out[..., sel] = data[..., ilat[sel] - lbs[k][0], ilon[sel] - lbs[k][1]]
+        return(out, *reverse_geo(ilat, ilon))
+
+    def query_regions(self, regions, variable, start_date, end_date, model = None, scenario = None,
+                      quality = None, slack = 0.25):
+        # regions is a sequence of (geo_lb, geo_ub) pairs. Overlapping and
+        # adjacent regions share one fetch; the result is a list of
+        # (data, lat, lon) per region, in the order given. Regions that share
+        # a fetch get copies, so writing into one does not change another.
+        if len(regions) == 0:
+            return([])
+        geo_lbs, geo_ubs = zip(*regions)
+        rlbs, rubs = discretize_boxes(geo_lbs, geo_ubs)
+        lbs, ubs, owner = _cover_boxes(rlbs, rubs, slack)
+        var_name = _build_var_name(variable, model, scenario, quality)
+        boxes = self._fetch_boxes(var_name, start_date, end_date, lbs, ubs)
+        shared = np.bincount(owner, minlength=len(lbs)) > 1
+        results = []
+        for r, k in enumerate(owner):
+            lat, lon = grid_coords(rlbs[r], rubs[r])
+            if boxes[k] is None:
+                results.append(None)
+                continue
+            a0, b0 = rlbs[r] - lbs[k]
+            a1, b1 = rubs[r] - lbs[k] + 1
+            data = boxes[k][..., a0:a1, b0:b1]
+            results.append((data.copy() if shared[k] else data, lat, lon))
+        return(results)
+
+    def iter_query(self, variable, start_date, end_date, model = None, scenario = None, quality = None,
+                   geo_lb = (-60.0,-180.0), geo_ub = (90.0,180.0), window = '30D', prefetch = 2,
+                   dtype = None, scale = None, offset = None):
+        # Yields (data, dates) for consecutive windows of a planetary-gddp
+        # series while the next `prefetch` windows download in the background.
+        # The queue is topped up only once the caller asks for the next
+        # window, so at most prefetch + 1 windows are held at a time;
+        # prefetch = 0 fetches each window on demand.
+        days = int(window[:-1]) if isinstance(window, str) and window.endswith('D') else int(window)
+        if days < 1:
+            raise ValueError(f'window must be at least one day, got {window}.')
+        lb = _discretize_geo(*geo_lb)
+        ub = _discretize_geo(*geo_ub)
+        assert lb[0] <= ub[0] and lb[1] <= ub[1]
+        var_name = _build_var_name(variable, model, scenario, quality)
+        windows = iter(_split_dates(start_date, end_date, days))
+        pool = ThreadPoolExecutor(max_workers = max(1, prefetch))
+        pending = deque()
+        def submit():
+            for s, e in windows:
+                pending.append((pool.submit(self._fetch_compact, var_name, s, e, lb, ub, None, dtype, scale, offset), s, e))
+                return
+        try:
+            for _ in range(prefetch):
+                submit()
+            while True:
+                if not pending:
+                    submit()
+                if not pending:
+                    break
+                fut, s, e = pending.popleft()
+                if prefetch:
+                    submit()
+                dates = np.arange(np.datetime64(s), np.datetime64(e) + 1, dtype = 'datetime64[D]')
+                yield(fut.result(), dates)
+        finally:
+            for fut, _, _ in pending:
+                fut.cancel()
+            pool.shutdown(wait = False)
+
     def query(self, source, **kwargs):
         if source == 'planetary-gddp':
             return(self._query_pc(**kwargs))
 
-    def write(self, variable, model, data, **kwargs):
-        self.api.PutNDArray(data, f'v:{variable},m:{model}', 0, (0,0))
+    def write(self, variable, model, data, geo_offset = (-60.0,-180.0), geo_resolution = (0.25,0.25), **kwargs):
+        if tuple(geo_resolution) != (0.25, 0.25):
+            raise ValueError(f'unsupported geo_resolution {geo_resolution}; the grid is 0.25 degrees.')
+        lb = _discretize_geo(*geo_offset)
+        if lb[0] + data.shape[-2] > 600 or lb[1] + data.shape[-1] > 1440:
+            raise ValueError(f'data of shape {data.shape} at {geo_offset} extends past the grid.')
+        offset = (0,) * (data.ndim - 2) + lb
+        self.api.PutNDArrayChunked(data, f'v:{variable},m:{model}', 0, offset,
+                                   chunk_bytes = self.tile_bytes, max_workers = self.max_workers)
+        if self.catalog is not None:
+            self.catalog.invalidate(f'v:{variable},m:{model}')
 
     def _build_arg_pc(variable, start_date, end_date, model = None, scenario = None, geo_lb = (-60.0,-180.0), geo_ub = (90.0,180.0)):
         lb = _discretize_geo(*geo_lb)
@@ -84,10 +446,73 @@ class DXInterface:
         elif source == 'local':
             return(DXInterface._build_arg_local(**kwargs))
 
-    def exec(self, fn, args):
+    def _exec_fn(self, fn, dtype):
+        if dtype is None:
+            return(fn)
+        if np.dtype(dtype).kind != 'f':
+            raise ValueError(f'exec results can only be cast to a float dtype, not {dtype}.')
+        return(cast_result(fn, dtype))
+
+    def exec(self, fn, args, dtype = None):
+        # dtype (e.g. 'float32') casts the result where fn runs, before it is
+        # sent back.
+        fn = self._exec_fn(fn, dtype)
+        if self.catalog is not None:
+            self.catalog.validate(args)
+        if self.executor is not None:
+            return(self.executor.exec(fn, args))
         return(self.api.Exec(args, fn))
 
+    def exec_many(self, fn, arg_lists, dtype = None):
+        fn = self._exec_fn(fn, dtype)
+        if self.catalog is not None:
+            arg_lists = list(arg_lists)
+            for args in arg_lists:
+                self.catalog.validate(args)
+        if self.executor is not None:
+            return(((i, self.executor.exec(fn, args)) for i, args in enumerate(arg_lists)))
+        return(self.api.ExecMany(arg_lists, fn, max_workers = self.max_workers))
+
+class AsyncDXInterface:
+    # Asynchronous counterpart of DXInterface. Queries reuse the synchronous
+    # request building and run on the AsyncDXDataAPI worker pool.
+    def __init__(self, socket, concurrency = 8, **api_kwargs):
+        api_kwargs.setdefault('pool_maxsize', concurrency)
+        self.client = DXInterface(socket, **api_kwargs)
+        self.api = AsyncDXDataAPI(concurrency = concurrency, api = self.client.api)
+
+    async def query(self, source, **kwargs):
+        return(await self.api._call(self.client.query, source, **kwargs))
+
+    async def gather_query(self, queries):
+        # queries is a sequence of keyword dicts as accepted by query(); the
+        # data arrays are returned in the same order.
+        import asyncio
+        results = await asyncio.gather(*[self.query(**q) for q in queries])
+        return([r[0] if r is not None else None for r in results])
+
+    async def write(self, variable, model, data, **kwargs):
+        return(await self.api._call(self.client.write, variable, model, data, **kwargs))
+
+    async def exec(self, fn, args, dtype = None):
+        # Goes through DXInterface.exec, so a local executor and the catalog
+        # check apply as they do for the synchronous client.
+        return(await self.api._call(self.client.exec, fn, args, dtype))
+
+    build_arg = staticmethod(DXInterface.build_arg)
+
+    def close(self):
+        self.api.close()
+
+    async def __aenter__(self):
+        return(self)
+
+    async def __aexit__(self, *exc):
+        self.close()
+
 if __name__ == "__main__":
+    import netCDF4 as nc
+    from wet_bulb import pressurefromelev, regridder
     client = DXInterface('20.84.58.28:8000')
     data = client.query(source = 'planetary-gddp',
 		variable = 'tas',
@@ -98,18 +523,6 @@ if __name__ == "__main__":
 		geo_ub = (40.7,-74.0))[0]
     print(data.shape)
     print(data)
-    def pressurefromelev(elev):
-        #Necessary constants
-        Tbase=288;      #temperature at base of atmosphere -- K
-        L=-6.5;         #lapse rate -- K/km
-        G=-9.81;        #gravity -- m/s^2
-        M=28.96;        #density of air -- kg/mol
-        R=8.314;        #universal gas constant -- J/(kg*mol)
-
-        #Note that mean global sea-level pressure over land is approx 1010 hPa
-        pressure=100*np.round(1010*((Tbase+L*10**-3*elev)/Tbase)**((G*M)/(R*L)),2);
-        return pressure
-
     f=nc.Dataset('elev_721x1440.nc'); #geopotential
     z=f['z'][:,:,:]/9.81;z_orig=z[0,:,:]; #converted to meters, centered on 180W
 
@@ -123,9 +536,8 @@ if __name__ == "__main__":
     for m in range(len(models)):
         lat_des=np.linspace(-90,90,modellatsz[m])
         lon_des=np.linspace(-180,180,modellonsz[m]);
-        interp = RegularGridInterpolator((lat_cur, lon_cur), z_orig,bounds_error=False,fill_value=None);
-        X,Y = np.meshgrid(lat_des,lon_des,indexing='ij')
-        z_interp=interp((X,Y))
+        regrid = regridder(lat_cur, lon_cur, lat_des, lon_des, cache_dir = '.regrid');
+        z_interp=regrid(z_orig, dtype = np.float32)
         psfc_chunk=pressurefromelev(z_interp[:,:]);
     pressure = psfc_chunk
     
@@ -0,0 +1,133 @@
+from datetime import timedelta
+import numpy as np
+from dx_data_api import ExecArg, _detach_globals
+
+def _make_reducer(ops):
+    # Builds the function shipped to the server for pushdown.
+    def reduce_fn(x):
+        import numpy as np
+        for name, axes, q in ops:
+            if name == 'percentile':
+                x = np.percentile(x, q, axis=axes, keepdims=True)
+            else:
+                x = getattr(np, name)(x, axis=axes, keepdims=True)
+        return(x)
+    return(_detach_globals(reduce_fn))
+
+class DXDeferredArray:
+    # A planetary-gddp query that has not been fetched yet. Slicing, time
+    # selection and reductions are recorded; compute() turns slicing into the
+    # smallest box/date range and, if reductions are pending, runs them on the
+    # server with Exec so only the reduced result is transferred. Axes are
+    # (time, lat, lon) with one time step per day.
+    def __init__(self, client, var_name, start_date, end_date, lb, ub):
+        self.client = client
+        self.var_name = var_name
+        from dx_interface import _parse_date
+        self.start = _parse_date(start_date)
+        self.end = _parse_date(end_date)
+        self.lb = tuple(lb)
+        self.ub = tuple(ub)
+        self._ops = []
+        # Axes of the full (time, lat, lon) array still visible to the user,
+        # and those dropped by integer indexing or reductions.
+        self._axes = [0, 1, 2]
+        self._dropped = []
+
+    def _copy(self):
+        other = DXDeferredArray.__new__(DXDeferredArray)
+        other.__dict__.update(self.__dict__)
+        other._ops = list(self._ops)
+        other._axes = list(self._axes)
+        other._dropped = list(self._dropped)
+        return(other)
+
+    @property
+    def shape(self):
+        full = ((self.end - self.start).days + 1, self.ub[0] - self.lb[0] + 1, self.ub[1] - self.lb[1] + 1)
+        reduced = set(a for _, axes, _ in self._ops for a in axes)
+        return(tuple(full[a] for a in self._axes if a not in reduced))
+
+    def __repr__(self):
+        ops = ', '.join(op[0] for op in self._ops) or 'none'
+        return(f'DXDeferredArray({self.var_name}, {self.start}..{self.end}, lb={self.lb}, ub={self.ub}, ops={ops})')
+
+    def __getitem__(self, key):
+        if self._ops:
+            raise ValueError('slice a deferred array before reducing it.')
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > len(self._axes):
+            raise IndexError(f'too many indices for a {len(self._axes)}-d deferred array.')
+        other = self._copy()
+        full = ((self.end - self.start).days + 1, self.ub[0] - self.lb[0] + 1, self.ub[1] - self.lb[1] + 1)
+        bounds = [(0, n - 1) for n in full]
+        for axis, k in zip(self._axes, key):
+            n = full[axis]
+            if isinstance(k, slice):
+                start, stop, step = k.indices(n)
+                if step != 1 or stop <= start:
+                    raise IndexError('deferred arrays support non-empty unit-step slices only.')
+                bounds[axis] = (start, stop - 1)
+            else:
+                i = int(k) + n if int(k) < 0 else int(k)
+                if not 0 <= i < n:
+                    raise IndexError(f'index {k} out of range for axis of length {n}.')
+                bounds[axis] = (i, i)
+                other._axes.remove(axis)
+                other._dropped.append(axis)
+        other.start = self.start + timedelta(days = bounds[0][0])
+        other.end = self.start + timedelta(days = bounds[0][1])
+        other.lb = (self.lb[0] + bounds[1][0], self.lb[1] + bounds[2][0])
+        other.ub = (self.lb[0] + bounds[1][1], self.lb[1] + bounds[2][1])
+        return(other)
+
+    def sel_time(self, start_date, end_date):
+        if 0 not in self._axes or self._ops:
+            raise ValueError('time selection needs an unreduced time axis.')
+        from dx_interface import _parse_date
+        s = (_parse_date(start_date) - self.start).days
+        e = (_parse_date(end_date) - self.start).days
+        key = [slice(None)] * len(self._axes)
+        key[0] = slice(max(s, 0), e + 1)
+        return(self[tuple(key)])
+
+    def _reduce(self, name, axis, q = None):
+        visible = [a for a in self._axes if all(a not in axes for _, axes, _ in self._ops)]
+        if axis is None:
+            axes = tuple(visible)
+        else:
+            axes = tuple(visible[a] for a in ((axis,) if isinstance(axis, int) else axis))
+        other = self._copy()
+        other._ops.append((name, axes, q))
+        return(other)
+
+    def mean(self, axis = None):
+        return(self._reduce('mean', axis))
+
+    def min(self, axis = None):
+        return(self._reduce('min', axis))
+
+    def max(self, axis = None):
+        return(self._reduce('max', axis))
+
+    def percentile(self, q, axis = None):
+        return(self._reduce('percentile', axis, q))
+
+    def compute(self, pushdown = True):
+        from dx_interface import _get_version
+        start, end = self.start.isoformat(), self.end.isoformat()
+        if self._ops and pushdown:
+            arg = ExecArg(self.var_name, _get_version(start, end), self.lb, self.ub, 'cmip6-planetary')
+            data = self.client.exec(_make_reducer(self._ops), [arg])
+        else:
+            data = self.client._fetch_pc(self.var_name, start, end, self.lb, self.ub)
+            if data is not None and self._ops:
+                data = _make_reducer(self._ops)(data)
+        if data is None:
+            return(None)
+        # Reductions keep their axes and indexed axes come back with length
+        # one, so all of them are squeezed out together at the end.
+        dropped = set(self._dropped) | set(a for _, axes, _ in self._ops for a in axes)
+        lead = data.ndim - 3
+        return(np.squeeze(data, axis = tuple(lead + a for a in sorted(dropped))))
@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import dill
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return(shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+def _run_chunk(fn_payload, specs, split, start, stop):
+    # Worker side of the process backend: map the shared inputs, slice this
+    # chunk out of the split ones and run the function on it.
+    fn = dill.loads(fn_payload)
+    shms = []
+    args = []
+    try:
+        for spec, s in zip(specs, split):
+            shm, arr = _attach(spec)
+            shms.append(shm)
+            args.append(arr[start:stop] if s else arr)
+        arr = None
+        result = fn(*args)
+        # Copied out so nothing returned refers to the shared buffers.
+        return(result.copy() if isinstance(result, np.ndarray) else result)
+    finally:
+        # Views into the shared buffers must be gone before closing them.
+        args.clear()
+        for shm in shms:
+            shm.close()
+
+class DXLocalExecutor:
+    # Client-side stand-in for server Exec with the same exec(fn, args)
+    # signature. The ExecArg boxes are fetched, then fn runs either on the
+    # whole arrays or, when it is separable along the first (time) axis as
+    # WetBulbArrays and other elementwise kernels are, on chunks of that axis
+    # in a pool. For chunks the highest-dimensional inputs are split and
+    # lower-dimensional ones such as a (lat, lon) pressure field are passed
+    # whole. separable = None decides per call by probing fn on one and two
+    # leading slices; True and False force either way.
+    def __init__(self, api, max_workers = None, processes = True, chunks_per_worker = 2, separable = None):
+        self.api = api
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.processes = processes
+        self.chunks_per_worker = chunks_per_worker
+        self.separable = separable
+
+    def _fetch(self, args):
+        with ThreadPoolExecutor(max_workers=len(args) or 1) as pool:
+            return(list(pool.map(lambda a: self.api.GetNDArray(a.name, a.version, a.lb, a.ub, nspace = a.namespace), args)))
+
+    def _chunks(self, length):
+        n = max(1, min(length, self.max_workers * self.chunks_per_worker))
+        edges = np.linspace(0, length, n + 1).astype(int)
+        return([(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a])
+
+    def exec(self, fn, args, separable = None):
+        arrays = self._fetch(args)
+        if any(a is None for a in arrays):
+            return(None)
+        return(self.run(fn, arrays, separable))
+
+    @staticmethod
+    def _splits(res, length):
+        return(isinstance(res, np.ndarray) and res.ndim > 0 and res.shape[0] == length)
+
+    def _probe(self, fn, arrays, split):
+        # A separable fn maps 1 and 2 leading slices to results with 1 and 2
+        # leading rows; reductions, scalars and tuples do not.
+        try:
+            one, two = [fn(*[a[:n] if s else a for a, s in zip(arrays, split)]) for n in (1, 2)]
+        except Exception:
+            return(False)
+        return(self._splits(one, 1) and self._splits(two, 2) and one.shape[1:] == two.shape[1:])
+
+    def run(self, fn, arrays, separable = None):
+        separable = self.separable if separable is None else separable
+        ndim = max(a.ndim for a in arrays)
+        split = [a.ndim == ndim and ndim > 0 for a in arrays]
+        lengths = set(a.shape[0] for a, s in zip(arrays, split) if s)
+        if len(lengths) != 1 or separable is False:
+            return(fn(*arrays))
+        length = lengths.pop()
+        chunks = self._chunks(length)
+        if len(chunks) <= 1 or self.max_workers == 1:
+            return(fn(*arrays))
+        if separable is None and (length < 2 or not self._probe(fn, arrays, split)):
+            return(fn(*arrays))
+        if self.processes:
+            results = self._run_processes(fn, arrays, split, chunks)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(lambda c: fn(*[a[c[0]:c[1]] if s else a for a, s in zip(arrays, split)]), chunks))
+        if not all(self._splits(res, stop - start) for (start, stop), res in zip(chunks, results)):
+            if separable:
+                raise ValueError('fn must return an array split along the same leading axis as its inputs.')
+            return(fn(*arrays))
+        out = np.empty((length,) + results[0].shape[1:], dtype=np.result_type(*results))
+        for (start, stop), res in zip(chunks, results):
+            out[start:stop] = res
+        return(out)
+
+    def _run_processes(self, fn, arrays, split, chunks):
+        # Inputs are copied once into shared memory so the workers map them
+        # instead of receiving a pickled copy per chunk.
+        shms = []
+        try:
+            specs = []
+            for a in arrays:
+                shm = shared_memory.SharedMemory(create=True, size=max(1, a.nbytes))
+                shms.append(shm)
+                np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+                specs.append((shm.name, a.shape, a.dtype.str))
+            fn_payload = dill.dumps(fn)
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(_run_chunk, fn_payload, specs, split, start, stop) for start, stop in chunks]
+                return([f.result() for f in futures])
+        finally:
+            for shm in shms:
+                shm.close()
+                shm.unlink()
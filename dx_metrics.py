@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+@dataclass
+class DXCallRecord:
+    # One DXDataAPI call (or cache lookup) as seen by the hooks. Phase times
+    # are in seconds; which phases appear depends on the call, e.g. 'encode',
+    # 'request' (send until response headers), 'download' and 'decode'.
+    method: str
+    target: str = None
+    status: int = None
+    phases: dict = field(default_factory=dict)
+    total: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    cells: int = 0
+    cache_hit: bool = None
+    retries: int = 0
+    hedged: bool = False
+    error: str = None
+    _start: float = field(default_factory=time.perf_counter, repr=False)
+    _last: float = field(default=None, repr=False)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - (self._last or self._start)
+        self._last = now
+
+    def finish(self):
+        self.total = time.perf_counter() - self._start
+
+class LoggingHook:
+    # Writes one log line per call.
+    def __init__(self, logger = None, level = logging.INFO):
+        self.logger = logger or logging.getLogger('dxclient')
+        self.level = level
+
+    def __call__(self, record):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        phases = ' '.join(f'{k}={v*1000:.1f}ms' for k, v in record.phases.items())
+        self.logger.log(self.level, '%s %s status=%s total=%.1fms %s sent=%d recv=%d cells=%d%s%s',
+                        record.method, record.target, record.status, record.total * 1000, phases,
+                        record.bytes_sent, record.bytes_received, record.cells,
+                        ('' if record.cache_hit is None else f' cache_hit={record.cache_hit}')
+                        + (f' retries={record.retries}' if record.retries else '')
+                        + (' hedged' if record.hedged else ''),
+                        f' error={record.error}' if record.error else '')
+
+class DXMetrics:
+    # Aggregates call records per method; pass an instance as a hook and read
+    # summary() whenever needed.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'seconds': 0.0, 'bytes_sent': 0,
+                                               'bytes_received': 0, 'cells': 0, 'cache_hits': 0,
+                                               'retries': 0, 'hedged': 0,
+                                               'phases': defaultdict(float)})
+
+    def __call__(self, record):
+        with self._lock:
+            s = self._stats[record.method]
+            s['calls'] += 1
+            s['errors'] += record.error is not None
+            s['seconds'] += record.total
+            s['bytes_sent'] += record.bytes_sent
+            s['bytes_received'] += record.bytes_received
+            s['cells'] += record.cells
+            s['cache_hits'] += bool(record.cache_hit)
+            s['retries'] += record.retries
+            s['hedged'] += record.hedged
+            for phase, t in record.phases.items():
+                s['phases'][phase] += t
+
+    def summary(self):
+        with self._lock:
+            return({m: dict(s, phases=dict(s['phases'])) for m, s in self._stats.items()})
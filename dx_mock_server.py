@@ -0,0 +1,283 @@
+import email.parser
+import email.policy
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import dill
+from dx_codec import ChunkDecoder, encode
+from dx_data_api import _tag_to_dtype
+
+# In-process stand-in for the DataSpaces REST server, covering the routes
+# DXDataAPI uses: /dspaces/obj, /dspaces/exec, /dspaces/var and
+# /dspaces/register. Objects live in memory; reads of the cmip6-planetary
+# namespace that were never written are synthesized from the version's start
+# day and span, so planetary-gddp queries work without any data. Latency and
+# 5xx errors can be injected for benchmarks and failure testing.
+
+def _parse_multipart(content_type, body):
+    msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    return({p.get_param('name', header='content-disposition'): p.get_payload(decode=True) for p in msg.iter_parts()})
+
+def _parse_form(headers, body):
+    content_type = headers.get('Content-Type', '')
+    if content_type.startswith('multipart/'):
+        return(_parse_multipart(content_type, body))
+    return({k: v[0].encode() for k, v in parse_qs(body.decode()).items()})
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.dx._track(self.connection, True)
+
+    def finish(self):
+        self.server.dx._track(self.connection, False)
+        super().finish()
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            return(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        # Streamed uploads of unknown length arrive chunked.
+        body = bytearray()
+        while True:
+            size = int(self.rfile.readline().split(b';')[0], 16)
+            if size == 0:
+                while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return(bytes(body))
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def _send(self, code, data = b'', headers = None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        server = self.server.dx
+        body = self._body()
+        if server.delay:
+            time.sleep(server.delay() if callable(server.delay) else server.delay)
+        if server.error_rate and random.random() < server.error_rate:
+            return(self._send(503, b'{"detail": "injected failure"}'))
+        server.requests += 1
+        if len(parts) < 2 or parts[0] != 'dspaces':
+            return(self._send(404))
+        handler = getattr(self, f'_{method}_{parts[1]}', None)
+        if handler is None:
+            return(self._send(405))
+        handler(server, parts[2:], query, body)
+
+    def do_GET(self):
+        self._route('get')
+
+    def do_POST(self):
+        self._route('post')
+
+    def do_PUT(self):
+        self._route('put')
+
+    def _put_obj(self, server, parts, query, body):
+        name, version = parts[0], int(parts[1])
+        form = _parse_form(self.headers, body)
+        box = json.loads(form['box'])
+        dtype = _tag_to_dtype(int(query['element_type']))
+        shape = tuple(b['span'] for b in box['bounds'])
+        raw = form['data']
+        if 'encoding' in query:
+            buf = bytearray(int(np.prod(shape)) * dtype.itemsize)
+            decoder = ChunkDecoder(query['encoding'], dtype.itemsize, memoryview(buf))
+            decoder.feed(raw)
+            decoder.finish()
+            raw = buf
+        arr = np.frombuffer(raw, dtype=dtype).reshape(shape).copy()
+        offset = tuple(b['start'] for b in box['bounds'])
+        server.put(query.get('namespace'), name, version, offset, arr)
+        self._send(200, b'{}')
+
+    def _post_obj(self, server, parts, query, body):
+        name, version = parts[0], int(parts[1])
+        box = json.loads(body)
+        arr = server.get(query.get('namespace'), name, version, box['bounds'])
+        if arr is None:
+            return(self._send(404))
+        headers = {'x-ds-dims': ','.join(str(d) for d in arr.shape), 'x-ds-tag': str(arr.dtype.num)}
+        data = arr.tobytes()
+        accept = self.headers.get('x-ds-accept-encoding')
+        if accept:
+            data = encode(arr, accept)
+            headers['x-ds-encoding'] = accept
+        self._send(200, data, headers)
+
+    def _post_exec(self, server, parts, query, body):
+        form = _parse_form(self.headers, body)
+        requests = json.loads(form['requests'])['requests']
+        headers = {}
+        fn_hash = (form.get('fn_hash', b'').decode() or None) if server.fn_hash else None
+        if 'fn' in form:
+            fn = dill.loads(form['fn'])
+            if fn_hash:
+                server.functions[fn_hash] = fn
+                headers['x-ds-fn-hash'] = fn_hash
+        elif fn_hash in server.functions:
+            fn = server.functions[fn_hash]
+        elif not server.fn_hash:
+            return(self._send(422, b'{"detail": "fn is required"}'))
+        else:
+            return(self._send(412, b'{"detail": "unknown function hash"}'))
+        args = [server.get(r.get('namespace'), r['name'], r['version'], r['bounds']) for r in requests]
+        if any(a is None for a in args):
+            return(self._send(404))
+        self._send(200, dill.dumps(fn(*args)), headers)
+
+    def _send_listing(self, content):
+        # Listings carry an ETag so clients can refresh them conditionally.
+        data = json.dumps(content).encode()
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            return(self._send(304, b'', {'ETag': etag}))
+        self._send(200, data, {'ETag': etag})
+
+    def _get_var(self, server, parts, query, body):
+        if not parts:
+            return(self._send_listing(server.var_names()))
+        objs = server.var_objs(parts[0])
+        if objs is None:
+            return(self._send(404))
+        self._send_listing(objs)
+
+    def _post_register(self, server, parts, query, body):
+        handle = {'namespace': parts[1], 'parameters': json.loads(body or b'{}')}
+        self._send(200, json.dumps(handle).encode())
+
+class DXMockServer:
+    def __init__(self, host = '127.0.0.1', port = 0, delay = 0, error_rate = 0.0, synth_dtype = np.float32,
+                 fn_hash = True):
+        self.delay = delay
+        self.error_rate = error_rate
+        self.synth_dtype = np.dtype(synth_dtype)
+        # fn_hash = False stands in for a server without hash-only Exec.
+        self.fn_hash = fn_hash
+        self.objects = {}
+        self.functions = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.dx = self
+        self.socket = f'{host}:{self._httpd.server_address[1]}'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return(self)
+
+    def _track(self, connection, active):
+        with self._lock:
+            if active:
+                self._connections.add(connection)
+            else:
+                self._connections.discard(connection)
+
+    def stop(self):
+        # Keep-alive connections are closed too, so pooled clients see the
+        # server go away instead of being served by lingering handlers.
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+    def __enter__(self):
+        return(self.start())
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def put(self, nspace, name, version, offset, arr):
+        with self._lock:
+            pieces = self.objects.setdefault((nspace, name, version), [])
+            # A rewrite of the same box replaces the earlier piece.
+            pieces[:] = [(o, a) for o, a in pieces if o != offset or a.shape != arr.shape]
+            pieces.append((offset, arr))
+
+    def get(self, nspace, name, version, bounds):
+        lb = [b['start'] for b in bounds]
+        ub = [b['start'] + b['span'] - 1 for b in bounds]
+        with self._lock:
+            pieces = list(self.objects.get((nspace, name, version), []))
+        if pieces:
+            out = np.zeros([b['span'] for b in bounds], dtype=pieces[0][1].dtype)
+            found = False
+            for offset, arr in pieces:
+                lo = [max(l, o) for l, o in zip(lb, offset)]
+                hi = [min(u, o + s - 1) for u, o, s in zip(ub, offset, arr.shape)]
+                if any(a > b for a, b in zip(lo, hi)):
+                    continue
+                found = True
+                out[tuple(slice(a-l, b-l+1) for a, b, l in zip(lo, hi, lb))] = \
+                    arr[tuple(slice(a-o, b-o+1) for a, b, o in zip(lo, hi, offset))]
+            return(out if found else None)
+        if nspace == 'cmip6-planetary':
+            return(self._synthesize(version, lb, ub))
+        return(None)
+
+    def _synthesize(self, version, lb, ub):
+        # Deterministic smooth field: value depends on absolute day and grid
+        # cell, so tiled and whole-box reads can be compared exactly.
+        start, span = version >> 16, version & 0xffff
+        day = np.arange(start, start + span + 1, dtype=np.float64)[:, None, None]
+        lat = np.arange(lb[0], ub[0] + 1, dtype=np.float64)[None, :, None]
+        lon = np.arange(lb[1], ub[1] + 1, dtype=np.float64)[None, None, :]
+        field = 273.15 + 20.0 * np.cos((lat - 240.0) / 380.0) + 5.0 * np.sin(day / 58.1) + 0.01 * lon
+        return(field.astype(self.synth_dtype))
+
+    def var_names(self):
+        with self._lock:
+            return(sorted(set(name for _, name, _ in self.objects)))
+
+    def var_objs(self, name):
+        with self._lock:
+            objs = []
+            for (nspace, n, version), pieces in self.objects.items():
+                if n != name:
+                    continue
+                for offset, arr in pieces:
+                    objs.append({'name': n, 'version': version, 'namespace': nspace,
+                                 'lb': list(offset), 'ub': [o + s - 1 for o, s in zip(offset, arr.shape)]})
+        return(objs or None)
+
+if __name__ == "__main__":
+    server = DXMockServer(port=8002).start()
+    print(f'serving on {server.socket}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,172 @@
+import functools
+from dataclasses import dataclass
+import numpy as np
+from dx_data_api import _detach_globals
+
+# Packed int16 values follow the CF scale_factor/add_offset convention:
+# value = packed * scale + offset, with -32768 marking missing (NaN) cells.
+_INT16_FILL = -32768
+_INT16_MAX = 32767
+
+@dataclass
+class PackedArray:
+    data: np.ndarray
+    scale: float
+    offset: float
+    fill: int = _INT16_FILL
+
+    @property
+    def shape(self):
+        return(self.data.shape)
+
+    def unpack(self, dtype = np.float32):
+        out = self.data.astype(dtype)
+        out *= self.scale
+        out += self.offset
+        out[self.data == self.fill] = np.nan
+        return(out)
+
+def int16_params(vmin, vmax):
+    # scale and offset that map [vmin, vmax] onto the valid int16 range.
+    offset = (float(vmax) + float(vmin)) / 2.0
+    scale = (float(vmax) - float(vmin)) / (2 * _INT16_MAX) or 1.0
+    return(scale, offset)
+
+def pack_int16(arr, scale = None, offset = None, out = None):
+    # Packs arr in blocks so the float temporaries stay small. Without scale
+    # and offset they are fitted to the data range. Values outside the
+    # representable range are clipped.
+    arr = np.asarray(arr)
+    if scale is None or offset is None:
+        # Fitted on the finite values; infinities are clipped like any other
+        # out-of-range value instead of stretching the scale to inf.
+        finite = arr[np.isfinite(arr)]
+        scale, offset = int16_params(finite.min(), finite.max()) if finite.size else (1.0, 0.0)
+    if out is None:
+        out = np.empty(arr.shape, dtype=np.int16)
+    if out.shape != arr.shape or not out.flags.c_contiguous:
+        raise ValueError(f'out must be a C-contiguous array of shape {arr.shape}.')
+    src = arr.reshape(-1)
+    dst = out.reshape(-1)
+    block = 2**22
+    for i in range(0, src.size, block):
+        scaled = (src[i:i+block].astype(np.float64) - offset) / scale
+        missing = np.isnan(scaled)
+        np.clip(np.rint(scaled, out=scaled), -_INT16_MAX, _INT16_MAX, out=scaled)
+        scaled[missing] = _INT16_FILL
+        dst[i:i+block] = scaled
+    return(PackedArray(out, float(scale), float(offset)))
+
+def compact(data, dtype = None, scale = None, offset = None):
+    # Converts a query result to the requested compact dtype. 'int16' gives
+    # a PackedArray; float dtypes are a cast.
+    if dtype is None or data is None:
+        return(data)
+    if np.dtype(dtype) == np.int16:
+        return(pack_int16(data, scale, offset))
+    return(data.astype(dtype, copy=False))
+
+@functools.lru_cache(maxsize=64)
+def cast_result(fn, dtype):
+    # Wraps an Exec function so the server casts its result before sending
+    # it. Memoized so repeated calls reuse DXDataAPI's serialized payload.
+    dtype = np.dtype(dtype).str
+    def cast_fn(*args):
+        import numpy as np
+        return(np.asarray(fn(*args)).astype(dtype, copy=False))
+    return(_detach_globals(cast_fn))
+
+class DXTimeWriter:
+    # Writes a (time, ...) array to disk one time chunk at a time. Paths
+    # ending in .nc are written with netCDF4 (time is the unlimited
+    # dimension); anything else becomes a .npy file written through a
+    # memory map. For dtype int16 chunks are packed with scale and offset,
+    # which are then required up front since later chunks are not known yet;
+    # in NetCDF they are stored as scale_factor/add_offset so readers unpack
+    # transparently.
+    def __init__(self, path, shape, dtype = np.float32, scale = None, offset = 0.0, variable = 'data',
+                 dims = ('time', 'lat', 'lon'), coords = None, units = None, zlib = False):
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        if self.dtype == np.int16 and scale is None:
+            raise ValueError('int16 output needs an explicit scale (and offset).')
+        self.scale = scale
+        self.offset = offset
+        self._nc = None
+        if str(path).endswith('.nc'):
+            import netCDF4 as nc
+            self._nc = nc.Dataset(path, 'w')
+            for i, (name, size) in enumerate(zip(dims, self.shape)):
+                self._nc.createDimension(name, None if i == 0 else size)
+                if coords and name in coords:
+                    values = np.asarray(coords[name])
+                    if values.dtype.kind == 'M':
+                        values = values.astype('datetime64[D]').astype(np.int64)
+                        var = self._nc.createVariable(name, 'i4', (name,))
+                        var.units = 'days since 1970-01-01'
+                    else:
+                        var = self._nc.createVariable(name, values.dtype, (name,))
+                    var[:] = values
+            fill = _INT16_FILL if self.dtype == np.int16 else None
+            self._var = self._nc.createVariable(variable, self.dtype, dims[:len(self.shape)], zlib=zlib,
+                                                fill_value=fill,
+                                                chunksizes=(1,) + self.shape[1:] if zlib else None)
+            if self.dtype == np.int16:
+                self._var.scale_factor = scale
+                self._var.add_offset = offset
+            if units:
+                self._var.units = units
+        else:
+            self._var = np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype, shape=self.shape)
+
+    def write(self, start, data):
+        stop = start + data.shape[0]
+        if self._nc is not None:
+            # netCDF4 applies scale_factor/add_offset itself; NaN cells are
+            # masked (and their values replaced) so they become the fill value.
+            if self.dtype == np.int16:
+                missing = np.isnan(data)
+                data = np.ma.masked_array(np.where(missing, self.offset, data), mask=missing)
+            self._var[start:stop] = data
+        elif self.dtype == np.int16:
+            pack_int16(data, self.scale, self.offset, out = self._var[start:stop])
+        else:
+            self._var[start:stop] = data
+
+    def close(self):
+        if self._nc is not None:
+            self._nc.close()
+        else:
+            self._var.flush()
+            del self._var
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_time_chunks(fn, arrays, path, chunk = 8, **writer_kwargs):
+    # Runs fn over time chunks of arrays and streams each result to path, so
+    # only one chunk of inputs, temporaries and output is in memory at once.
+    # As with DXLocalExecutor, the highest-dimensional inputs are split along
+    # their first axis and the others (e.g. a (lat, lon) pressure field) are
+    # passed whole. Inputs may themselves be memory maps or netCDF4
+    # variables, which are then also read a chunk at a time.
+    ndim = max(np.ndim(a) for a in arrays)
+    split = [np.ndim(a) == ndim for a in arrays]
+    length = next(a.shape[0] for a, s in zip(arrays, split) if s)
+    whole = [None if s else np.asarray(a) for a, s in zip(arrays, split)]
+    writer = None
+    try:
+        for start in range(0, length, chunk):
+            args = [np.asarray(a[start:start+chunk]) if s else w for a, s, w in zip(arrays, split, whole)]
+            result = np.asarray(fn(*args))
+            if writer is None:
+                writer = DXTimeWriter(path, (length,) + result.shape[1:], **writer_kwargs)
+            writer.write(start, result)
+    finally:
+        if writer is not None:
+            writer.close()
+    return(path)
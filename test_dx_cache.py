@@ -0,0 +1,44 @@
+import os
+import numpy as np
+from dx_cache import DXChunkCache
+
+def _arr(seed, shape = (2, 8, 8)):
+    return(np.random.default_rng(seed).random(shape).astype(np.float32))
+
+def test_hits_do_not_rewrite_index(tmp_path):
+    cache = DXChunkCache(str(tmp_path))
+    cache.put('v', 1, (0, 0), (7, 7), _arr(0))
+    index = tmp_path / 'index.json'
+    before = index.read_text()
+    mtime = os.stat(index).st_mtime_ns
+    for _ in range(5):
+        np.testing.assert_array_equal(cache.get('v', 1, (2, 2), (5, 5)), _arr(0)[:, 2:6, 2:6])
+    assert os.stat(index).st_mtime_ns == mtime and index.read_text() == before
+    cache.flush()
+    assert index.read_text() != before
+
+def test_shared_directory_merges_index(tmp_path):
+    a = DXChunkCache(str(tmp_path))
+    b = DXChunkCache(str(tmp_path))
+    a.put('v', 1, (0, 0), (7, 7), _arr(1))
+    b.put('v', 2, (0, 0), (7, 7), _arr(2))
+    # Each sees the other's entry, and neither write lost the other's.
+    np.testing.assert_array_equal(b.get('v', 1, (0, 0), (7, 7)), _arr(1))
+    np.testing.assert_array_equal(a.get('v', 2, (0, 0), (7, 7)), _arr(2))
+    assert len(DXChunkCache(str(tmp_path))._entries) == 2
+
+def test_shared_eviction_keeps_index_consistent(tmp_path):
+    nbytes = _arr(0).nbytes
+    caches = [DXChunkCache(str(tmp_path), max_bytes = 3 * nbytes) for _ in range(2)]
+    for i in range(10):
+        caches[i % 2].put('v', i, (0, 0), (7, 7), _arr(i))
+    for cache in caches:
+        cache.flush()
+    entries = DXChunkCache(str(tmp_path))._entries
+    assert len(entries) == 3
+    assert sorted(e['version'] for e in entries.values()) == [7, 8, 9]
+    files = sorted(p.name for p in tmp_path.glob('*.npy'))
+    assert files == sorted(e['file'] for e in entries.values())
+    for cache in caches:
+        assert cache.get('v', 2, (0, 0), (7, 7)) is None
+        np.testing.assert_array_equal(cache.get('v', 9, (0, 0), (7, 7)), _arr(9))
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from dx_catalog import DXCatalog, _box_covered, parse_var_name
+from dx_data_api import DXDataAPI, ExecArg
+from dx_interface import DXInterface
+
+def test_parse_var_name():
+    assert parse_var_name('v:tas,m:ACCESS-ESM1-5,s:ssp585') == {'variable': 'tas', 'model': 'ACCESS-ESM1-5',
+                                                              'scenario': 'ssp585'}
+    assert parse_var_name('m:x') is None
+    assert parse_var_name('ex_api2') is None
+
+@pytest.mark.parametrize('lb, ub, covered', [
+    ((0, 0), (9, 9), True),      # exactly the union of the halves
+    ((2, 3), (7, 8), True),      # inside the union, across the seam
+    ((0, 0), (9, 10), False),    # one column past the edge
+    ((10, 0), (10, 0), False),   # outside every piece
+    ((3, 11), (4, 14), False),   # falls in the gap between pieces
+    ((3, 15), (4, 19), True),    # inside the overlapping pair on the right
+])
+def test_box_covered_union(lb, ub, covered):
+    boxes = [((0, 0), (4, 9)), ((5, 0), (9, 9)),
+             ((0, 15), (6, 18)), ((2, 17), (9, 19)),
+             # Other ranks are ignored.
+             ((0, 0, 0), (99, 99, 99))]
+    assert _box_covered(lb, ub, boxes) is covered
+
+def test_box_covered_empty():
+    assert not _box_covered((0, 0), (1, 1), [])
+
+class _Spy:
+    # Records whether each listing request returned new content.
+    def __init__(self, api):
+        self.modified = []
+        self._get_listing = api._get_listing
+        api._get_listing = self
+
+    def __call__(self, url, etag = None):
+        result = self._get_listing(url, etag)
+        self.modified.append((url, result[0]))
+        return(result)
+
+def test_refresh_is_conditional(server):
+    with DXDataAPI(server.socket) as api:
+        api.PutNDArray(np.zeros((4, 4), dtype=np.float32), 'v:tas,m:a', 0, (0, 0))
+        spy = _Spy(api)
+        catalog = DXCatalog(api, ttl = 0)
+        assert catalog.names() == ['v:tas,m:a']
+        catalog.refresh()
+        # Unchanged, so the second listing is a 304.
+        assert spy.modified == [('dspaces/var/', True), ('dspaces/var/', False)]
+        assert catalog.names() == ['v:tas,m:a']
+        api.PutNDArray(np.zeros((4, 4), dtype=np.float32), 'v:pr,m:a', 0, (0, 0))
+        assert catalog.find(model = 'a') == ['v:pr,m:a', 'v:tas,m:a']
+        assert spy.modified[-1] == ('dspaces/var/', True)
+        assert catalog.values('variable', model = 'a') == ['pr', 'tas']
+
+def test_ttl_avoids_requests(server):
+    with DXDataAPI(server.socket) as api:
+        spy = _Spy(api)
+        catalog = DXCatalog(api, ttl = 3600)
+        for _ in range(3):
+            catalog.names()
+        assert len(spy.modified) == 1
+
+def test_invalidate_after_write(server):
+    with DXInterface(server.socket, catalog_ttl = 3600) as client:
+        catalog = client.catalog
+        assert not catalog.has('v:tas,m:mine')
+        data = np.ones((2, 4, 4), dtype=np.float32)
+        client.write('tas', 'mine', data, geo_offset = (0.0, 0.0))
+        assert catalog.has('v:tas,m:mine')
+        (obj,) = catalog.objects('v:tas,m:mine')
+        lb = obj['lb']
+        # A second piece is listed even though the name was already known.
+        client.write('tas', 'mine', data, geo_offset = (1.0, 0.0))
+        assert len(catalog.objects('v:tas,m:mine')) == 2
+        # One degree is four rows, so the pieces meet edge to edge.
+        assert catalog.covers('v:tas,m:mine', 0, lb, (1, lb[1] + 7, lb[2] + 3))
+        assert not catalog.covers('v:tas,m:mine', 0, lb, (1, lb[1] + 8, lb[2] + 3))
+        assert catalog.versions('v:tas,m:mine') == [0]
+
+def test_validate(server):
+    with DXDataAPI(server.socket) as api:
+        api.PutNDArray(np.zeros((4, 4), dtype=np.float32), 'v:tas,m:a', 0, (0, 0))
+        api.PutNDArray(np.zeros((4, 4), dtype=np.float32), 'v:tas,m:a', 0, (4, 0))
+        catalog = DXCatalog(api)
+        catalog.validate([ExecArg('v:tas,m:a', 0, (0, 0), (7, 3))])
+        # Namespace arguments are served without a listing and not checked.
+        catalog.validate([ExecArg('v:tas,m:x', 0, (0, 0), (3, 3), 'cmip6-planetary')])
+        with pytest.raises(ValueError, match = 'does not cover'):
+            catalog.validate([ExecArg('v:tas,m:a', 0, (0, 0), (8, 3))])
+        with pytest.raises(ValueError, match = 'does not cover'):
+            catalog.validate([ExecArg('v:tas,m:a', 1, (0, 0), (3, 3))])
+        with pytest.raises(ValueError, match = 'unknown variable'):
+            catalog.validate([ExecArg('v:pr,m:a', 0, (0, 0), (3, 3))])
+
+def test_exec_checks_catalog(server):
+    with DXInterface(server.socket, catalog_ttl = 3600) as client:
+        arg = DXInterface.build_arg(source = 'local', variable = 'tas', model = 'mymodel', geo_lb = (0.0, 0.0),
+                                    geo_ub = (1.0, 1.0))
+        with pytest.raises(ValueError, match = 'unknown variable'):
+            client.exec(np.negative, [arg])
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+import numpy as np
+import pytest
+import requests
+from dx_codec import available_codecs
+from dx_data_api import AsyncDXDataAPI, DXDataAPI, ExecArg
+from dx_mock_server import DXMockServer
+
+def test_reads_have_finite_default_timeouts():
+    api = DXDataAPI('127.0.0.1:1')
+    for call in ('GetNDArray', 'GetVars', 'GetVarObjs', 'GetListing'):
+        assert api.timeouts[call][1] is not None
+    assert 'Exec' not in api.timeouts and api.timeout[1] is None
+    assert DXDataAPI('127.0.0.1:1', timeouts = {'GetNDArray': (1, 5)}).timeouts['GetNDArray'] == (1, 5)
+
+def test_retries_recover_from_injected_errors(get):
+    random.seed(0)
+    records = []
+    with DXMockServer(error_rate = 0.5) as server, \
+         DXDataAPI(server.socket, retries = 10, backoff = 0.001, hooks = [records.append]) as api:
+        for i in range(20):
+            assert get(api, i).shape == (2, 4, 4)
+    assert sum(r.retries for r in records) > 0
+
+def test_no_retries_surfaces_error(get):
+    with DXMockServer(error_rate = 1.0) as server, DXDataAPI(server.socket, retries = 0) as api:
+        with pytest.raises(RuntimeError):
+            get(api)
+
+def test_stalled_read_times_out(get):
+    with DXMockServer(delay = 1.0) as server, \
+         DXDataAPI(server.socket, retries = 1, backoff = 0.001, timeouts = {'GetNDArray': (1, 0.1)}) as api:
+        t0 = time.perf_counter()
+        with pytest.raises(requests.RequestException):
+            get(api)
+        assert time.perf_counter() - t0 < 0.9
+
+def test_hedged_reads_cut_the_tail(get):
+    # Every fifth request stalls; the hedge (the next request) does not.
+    counter = itertools.count()
+    lock = threading.Lock()
+    def delay():
+        with lock:
+            n = next(counter)
+        return(0.5 if n % 5 == 4 else 0.0)
+    records = []
+    with DXMockServer(delay = delay) as server, \
+         DXDataAPI(server.socket, hedge_percentile = 50, hedge_min_delay = 0.02, hooks = [records.append]) as api:
+        for i in range(25):
+            get(api, i)
+        records.clear()
+        latencies = []
+        for i in range(25):
+            t0 = time.perf_counter()
+            assert get(api, i).shape == (2, 4, 4)
+            latencies.append(time.perf_counter() - t0)
+    assert any(r.hedged for r in records)
+    assert max(latencies) < 0.4
+
+def test_automatic_memmaps_leave_no_files(tmp_path, get):
+    with DXMockServer() as server, DXDataAPI(server.socket, mmap_threshold = 1, mmap_dir = str(tmp_path)) as api:
+        arr = get(api)
+        assert isinstance(arr, np.memmap)
+        expected = arr.copy()
+        del arr
+        assert list(tmp_path.iterdir()) == []
+        np.testing.assert_array_equal(get(api), expected)
+
+@pytest.mark.parametrize('compression', [None] + [c + '+shuffle' for c in available_codecs()])
+def test_put_streams_roundtrip(compression):
+    arr = np.random.default_rng(0).random((3, 50, 70)).astype(np.float32)
+    with DXMockServer() as server, DXDataAPI(server.socket, compression = compression, chunk_size = 4096) as api:
+        api.PutNDArray(arr, 'v:p,m:mymodel', 0, (0, 0, 0))
+        np.testing.assert_array_equal(api.GetNDArray('v:p,m:mymodel', 0, (0, 0, 0), (2, 49, 69)), arr)
+        # Non-contiguous input is sent in logical order.
+        api.PutNDArray(arr[:, ::2, ::3], 'v:q,m:mymodel', 0, (0, 0, 0))
+        np.testing.assert_array_equal(api.GetNDArray('v:q,m:mymodel', 0, (0, 0, 0), (2, 24, 23)), arr[:, ::2, ::3])
+
+def test_async_results_in_request_order_within_concurrency(server, get, in_flight):
+    with DXDataAPI(server.socket) as api:
+        expected = [get(api, i) for i in range(12)]
+        probe = in_flight(api.GetNDArray, 12)
+        api.GetNDArray = probe
+        async def run():
+            async with AsyncDXDataAPI(concurrency = 3, api = api) as aapi:
+                return(await asyncio.gather(*[get(aapi, i) for i in range(12)]))
+        results = asyncio.run(run())
+    assert probe.calls == 12 and probe.peak == 3
+    for r, e in zip(results, expected):
+        np.testing.assert_array_equal(r, e)
+
+def _mean(x):
+    return(x.mean(axis = 0))
+
+def _exec_args(version, n):
+    return([[ExecArg('v:tas,m:x', version, (i, 0), (i + 3, 3), 'cmip6-planetary')] for i in range(n)])
+
+def test_exec_many_yields_index_result_pairs(server, version):
+    arg_lists = _exec_args(version, 6)
+    with DXDataAPI(server.socket) as api:
+        results = dict(api.ExecMany(arg_lists, _mean, max_workers = 3))
+        assert sorted(results) == list(range(6))
+        for i, args in enumerate(arg_lists):
+            np.testing.assert_array_equal(results[i], api.Exec(args, _mean))
+
+def test_exec_many_propagates_errors(server, version):
+    with DXDataAPI(server.socket) as api:
+        send = api._send_exec
+        def failing_send(args, fn_entry):
+            if args[0].lb[0] == 2:
+                raise RuntimeError('injected exec failure')
+            return(send(args, fn_entry))
+        api._send_exec = failing_send
+        with pytest.raises(RuntimeError, match = 'injected'):
+            list(api.ExecMany(_exec_args(version, 6), _mean, max_workers = 2))
+
+def test_exec_many_close_cancels_pending_calls(server, version):
+    with DXDataAPI(server.socket) as api:
+        calls = []
+        send = api._send_exec
+        def slow_send(args, fn_entry):
+            calls.append(args)
+            time.sleep(0.05)
+            return(send(args, fn_entry))
+        api._send_exec = slow_send
+        results = api.ExecMany(_exec_args(version, 20), _mean, max_workers = 2)
+        next(results)
+        results.close()
+        time.sleep(0.3)
+        # Only calls already running when the generator closed go out.
+        assert len(calls) <= 4
+
+def _chunk_spy(api, fail_once = (), fail_always = ()):
+    # Wraps PutNDArray, recording each chunk's offset and failing the first
+    # upload of the offsets in fail_once and every upload of fail_always.
+    calls = []
+    put = api.PutNDArray
+    def spy(sub, name, version, offset, nspace = None):
+        calls.append(offset)
+        if offset in fail_always or (offset in fail_once and calls.count(offset) == 1):
+            raise RuntimeError('injected chunk failure')
+        return(put(sub, name, version, offset, nspace))
+    api.PutNDArray = spy
+    return(calls)
+
+def test_chunked_put_roundtrip_at_offset(server):
+    arr = np.arange(3 * 10 * 12, dtype=np.float32).reshape(3, 10, 12)
+    with DXDataAPI(server.socket) as api:
+        calls = _chunk_spy(api)
+        api.PutNDArrayChunked(arr, 'v:c,m:mymodel', 0, (0, 5, 7), chunk_bytes = 4 * 40, max_workers = 3)
+        assert len(calls) == len(set(calls)) > 1
+        np.testing.assert_array_equal(api.GetNDArray('v:c,m:mymodel', 0, (0, 5, 7), (2, 14, 18)), arr)
+
+def test_chunked_put_resends_only_failed_chunks(server):
+    arr = np.arange(8 * 8, dtype=np.float32).reshape(8, 8)
+    with DXDataAPI(server.socket) as api:
+        # Sixteen cells per chunk splits the rows in pairs.
+        offsets = [(0, 0), (2, 0), (4, 0), (6, 0)]
+        failing = {(2, 0), (6, 0)}
+        calls = _chunk_spy(api, fail_once = failing)
+        api.PutNDArrayChunked(arr, 'v:c,m:mymodel', 0, (0, 0), chunk_bytes = 4 * 16, max_workers = 2, backoff = 0)
+        assert len(calls) == 6
+        for offset in offsets:
+            assert calls.count(offset) == (2 if offset in failing else 1)
+        # The retried chunks come after every first attempt.
+        assert set(calls[len(offsets):]) == failing
+        np.testing.assert_array_equal(api.GetNDArray('v:c,m:mymodel', 0, (0, 0), (7, 7)), arr)
+
+def test_chunked_put_gives_up_after_retries(server):
+    arr = np.zeros((8, 8), dtype=np.float32)
+    with DXDataAPI(server.socket) as api:
+        calls = _chunk_spy(api, fail_always = {(0, 0)})
+        with pytest.raises(RuntimeError, match = '1 of 4 chunks'):
+            api.PutNDArrayChunked(arr, 'v:c,m:mymodel', 0, (0, 0), chunk_bytes = 4 * 16, retries = 2, backoff = 0)
+        assert calls.count((0, 0)) == 3 and len(calls) == 6
@@ -0,0 +1,65 @@
+import contextlib
+import numpy as np
+from dx_data_api import DXDataAPI, ExecArg
+from dx_mock_server import DXMockServer
+
+@contextlib.contextmanager
+def _replicas(n, **kwargs):
+    with contextlib.ExitStack() as stack:
+        yield([stack.enter_context(DXMockServer(**kwargs)) for _ in range(n)])
+
+def _mean(t):
+    return(t.mean(axis=0))
+
+def test_round_robin_spreads_reads(get):
+    with _replicas(3) as servers, DXDataAPI([s.socket for s in servers]) as api:
+        for i in range(30):
+            get(api, i)
+    assert [s.requests for s in servers] == [10, 10, 10]
+
+def test_consistent_hash_pins_boxes(get):
+    with _replicas(3) as servers, DXDataAPI([s.socket for s in servers], policy = 'consistent-hash') as api:
+        for i in range(10):
+            before = [s.requests for s in servers]
+            get(api, 7)
+            after = [s.requests for s in servers]
+            changed = [a - b for a, b in zip(after, before)]
+            assert sorted(changed) == [0, 0, 1]
+            if i == 0:
+                owner = changed.index(1)
+            assert changed[owner] == 1
+
+def test_failover_ejects_stopped_replica(get):
+    with _replicas(3) as servers, \
+         DXDataAPI([s.socket for s in servers], retries = 2, backoff = 0.001, max_failures = 1) as api:
+        for i in range(6):
+            get(api, i)
+        servers[1].stop()
+        for i in range(12):
+            assert get(api, i).shape == (2, 4, 4)
+        stopped = api.endpoints.endpoints[1]
+        assert stopped.failures >= 1
+        assert stopped not in api.endpoints.healthy()
+
+def test_writes_go_to_every_replica():
+    with _replicas(3) as servers, DXDataAPI([s.socket for s in servers]) as api:
+        api.PutNDArray(np.arange(16, dtype=np.float32).reshape(4, 4), 'v:p,m:mymodel', 0, (0, 0))
+        for server in servers:
+            assert server.var_names() == ['v:p,m:mymodel']
+
+def test_fn_hash_support_is_per_replica(version):
+    with _replicas(2) as servers, DXMockServer(fn_hash = False) as old:
+        sockets = [s.socket for s in servers] + [old.socket]
+        arg = [ExecArg('v:tas,m:x', version, (0, 0), (3, 3), 'cmip6-planetary')]
+        records = []
+        with DXDataAPI(sockets, hooks = [records.append]) as api:
+            for _ in range(9):
+                assert api.Exec(arg, _mean).shape == (4, 4)
+            # Round-robin gives each replica three calls; after the first, the
+            # two hash-aware ones are sent the hash alone.
+            assert sum(r.bytes_sent == 0 for r in records) == 4
+            assert api._fn_hash_unsupported == {old.socket}
+            digest = api._fn_payload(_mean)[0]
+            for server in servers:
+                assert (server.socket, digest) in api._fn_registered
+                assert digest in server.functions
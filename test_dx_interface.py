@@ -0,0 +1,138 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+from dx_interface import AsyncDXInterface, DXInterface, _discretize_geo
+
+@pytest.fixture
+def client(server):
+    with DXInterface(server.socket) as client:
+        yield client
+
+def test_query_single_cell(client):
+    # A box this small fits the whole span into one window many times over.
+    data, lat, lon = client.query('planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                                  start_date = '1982-11-28', end_date = '1982-12-01',
+                                  geo_lb = (39.0,-76.0), geo_ub = (39.0,-76.0))
+    assert data.shape == (4, 1, 1)
+    assert lat.shape == (1,) and lon.shape == (1,)
+
+def test_query_points_sparse(client):
+    # Isolated points each become their own small fetch.
+    lats, lons = [39.0, 39.5, 10.0], [-76.0, -75.0, 20.0]
+    data, lat, lon = client.query_points(lats, lons, 'tas', '1982-11-28', '1982-12-01', model = 'ACCESS-ESM1-5')
+    assert data.shape == (4, 3)
+    for i in range(3):
+        ref, _, _ = client.query('planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                                 start_date = '1982-11-28', end_date = '1982-12-01',
+                                 geo_lb = (lats[i], lons[i]), geo_ub = (lats[i], lons[i]))
+        np.testing.assert_array_equal(data[:, i], ref[:, 0, 0])
+    np.testing.assert_allclose(lat, [39.125, 39.625, 10.125])
+
+def test_query_points_empty(client):
+    with pytest.raises(ValueError):
+        client.query_points([], [], 'tas', '1982-11-28', '1982-12-01', model = 'ACCESS-ESM1-5')
+
+def test_query_regions_empty(client):
+    assert client.query_regions([], 'tas', '1982-11-28', '1982-12-01', model = 'ACCESS-ESM1-5') == []
+
+def test_query_regions_overlap_copies(client):
+    regions = [((39.0,-76.0), (40.0,-75.0)), ((39.5,-75.5), (40.5,-74.5))]
+    (a, _, _), (b, _, _) = client.query_regions(regions, 'tas', '1982-11-28', '1982-11-29', model = 'ACCESS-ESM1-5')
+    before = b.copy()
+    a[...] = 0
+    np.testing.assert_array_equal(b, before)
+
+@pytest.mark.parametrize('prefetch', [0, 1, 2])
+def test_iter_query_prefetch_bound(client, prefetch):
+    started = []
+    fetch = client._fetch_compact
+    def counting_fetch(*args):
+        started.append(args[1])
+        return(fetch(*args))
+    client._fetch_compact = counting_fetch
+    blocks = client.iter_query('tas', '1982-01-01', '1982-01-20', model = 'ACCESS-ESM1-5',
+                               geo_lb = (39.0,-76.0), geo_ub = (40.0,-75.0), window = '2D', prefetch = prefetch)
+    seen = 0
+    for data, dates in blocks:
+        seen += 1
+        time.sleep(0.05)
+        # The block in hand plus at most prefetch more.
+        assert len(started) <= seen + prefetch
+        assert data.shape[0] == len(dates) == 2
+    assert seen == 10 and len(started) == 10
+
+def test_tiled_query_failure_cancels_remaining_tiles(server, monkeypatch):
+    with DXInterface(server.socket, tile_bytes = 4 * 16, max_workers = 2) as client:
+        calls = []
+        get = client.api.GetNDArray
+        def failing_get(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 3:
+                raise RuntimeError('injected tile failure')
+            return(get(*args, **kwargs))
+        monkeypatch.setattr(client.api, 'GetNDArray', failing_get)
+        with pytest.raises(RuntimeError, match = 'injected'):
+            client.query('planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                         start_date = '1982-01-01', end_date = '1982-12-31',
+                         geo_lb = (39.0,-76.0), geo_ub = (39.75,-75.25))
+        assert len(calls) < 20
+
+def test_query_regions_failure_cancels_remaining_boxes(server, monkeypatch):
+    with DXInterface(server.socket, max_workers = 1) as client:
+        calls = []
+        def failing_fetch(*args):
+            calls.append(args)
+            raise RuntimeError('injected box failure')
+        monkeypatch.setattr(client, '_fetch_pc', failing_fetch)
+        regions = [((10.0 * i, 0.0), (10.0 * i + 1, 1.0)) for i in range(8)]
+        with pytest.raises(RuntimeError, match = 'injected'):
+            client.query_regions(regions, 'tas', '1982-01-01', '1982-01-02', model = 'ACCESS-ESM1-5')
+        assert len(calls) < 8
+
+def test_gather_query_order_and_concurrency(server, client, in_flight):
+    dates = [f'1982-01-{d:02d}' for d in range(1, 11)]
+    queries = [dict(source = 'planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5', start_date = d,
+                    end_date = d, geo_lb = (39.0,-76.0), geo_ub = (39.5,-75.5)) for d in dates]
+    expected = [client.query(**q)[0] for q in queries]
+    async def run():
+        async with AsyncDXInterface(server.socket, concurrency = 4) as aclient:
+            probe = aclient.client.query = in_flight(aclient.client.query, len(queries))
+            return(await aclient.gather_query(queries), probe)
+    results, probe = asyncio.run(run())
+    assert probe.calls == len(queries) and probe.peak == 4
+    for r, e in zip(results, expected):
+        np.testing.assert_array_equal(r, e)
+
+def _celsius(t):
+    return(t - 273.15)
+
+def test_exec_many_pairs_match_exec(client):
+    arg_lists = [[DXInterface.build_arg(source = 'planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                                         start_date = d, end_date = d, geo_lb = (39.0,-76.0), geo_ub = (39.5,-75.5))]
+                 for d in ('1982-01-01', '1982-02-01', '1982-03-01')]
+    results = dict(client.exec_many(_celsius, arg_lists, dtype = 'float32'))
+    assert sorted(results) == [0, 1, 2]
+    for i, args in enumerate(arg_lists):
+        assert results[i].dtype == np.float32
+        np.testing.assert_array_equal(results[i], client.exec(_celsius, args, 'float32'))
+
+def test_write_at_geo_offset(client):
+    data = np.arange(2 * 8 * 12, dtype=np.float32).reshape(2, 8, 12)
+    client.tile_bytes = 4 * 32
+    client.write('tas', 'mymodel', data, geo_offset = (10.0, 20.0))
+    lb = (0,) + _discretize_geo(10.0, 20.0)
+    ub = (1, lb[1] + 7, lb[2] + 11)
+    np.testing.assert_array_equal(client.api.GetNDArray('v:tas,m:mymodel', 0, lb, ub), data)
+    # Written in several chunks, all placed inside the box.
+    objs = client.api.GetVarObjs('v:tas,m:mymodel')
+    assert len(objs) > 1
+    for o in objs:
+        assert all(l <= ol and ou <= u for l, u, ol, ou in zip(lb, ub, o['lb'], o['ub']))
+
+def test_write_rejects_bad_placement(client):
+    data = np.zeros((4, 4), dtype=np.float32)
+    with pytest.raises(ValueError, match = 'geo_resolution'):
+        client.write('tas', 'mymodel', data, geo_resolution = (0.5, 0.5))
+    with pytest.raises(ValueError, match = 'past the grid'):
+        client.write('tas', 'mymodel', data, geo_offset = (89.5, 0.0))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from dx_interface import DXInterface
+
+_QUERY = dict(variable = 'tas', model = 'ACCESS-ESM1-5', start_date = '1982-01-01', end_date = '1982-01-10',
+              geo_lb = (39.0,-76.0), geo_ub = (40.0,-75.0))
+
+@pytest.fixture
+def client(server):
+    with DXInterface(server.socket) as client:
+        yield client
+
+@pytest.fixture
+def eager(client):
+    return(client.query('planetary-gddp', **_QUERY)[0])
+
+@pytest.fixture
+def lazy(client):
+    return(client.query('planetary-gddp', lazy = True, **_QUERY))
+
+@pytest.mark.parametrize('pushdown', [True, False])
+@pytest.mark.parametrize('build, expect', [
+    (lambda a: a, lambda x: x),
+    (lambda a: a[2:5], lambda x: x[2:5]),
+    (lambda a: a[:, 1:3, -2:], lambda x: x[:, 1:3, -2:]),
+    (lambda a: a[3], lambda x: x[3]),
+    (lambda a: a[-1, 2], lambda x: x[-1, 2]),
+    (lambda a: a[:, :, 0], lambda x: x[:, :, 0]),
+    (lambda a: a.mean(axis = 0), lambda x: x.mean(axis = 0)),
+    (lambda a: a.mean(), lambda x: x.mean()),
+    (lambda a: a.max(axis = (1, 2)), lambda x: x.max(axis = (1, 2))),
+    (lambda a: a[1:4].min(axis = 1), lambda x: x[1:4].min(axis = 1)),
+    (lambda a: a[:, 2].mean(axis = 0), lambda x: x[:, 2].mean(axis = 0)),
+    (lambda a: a.mean(axis = 0).max(axis = 0), lambda x: x.mean(axis = 0).max(axis = 0)),
+    (lambda a: a.percentile(90, axis = 0), lambda x: np.percentile(x, 90, axis = 0)),
+    (lambda a: a.sel_time('1982-01-03', '1982-01-05').mean(axis = 0), lambda x: x[2:5].mean(axis = 0)),
+])
+def test_compute_matches_eager(lazy, eager, build, expect, pushdown):
+    deferred = build(lazy)
+    want = expect(eager)
+    got = deferred.compute(pushdown = pushdown)
+    assert deferred.shape == np.shape(want)
+    assert np.shape(got) == np.shape(want)
+    np.testing.assert_allclose(got, want, rtol = 1e-6)
+
+def test_non_iso_dates(client, eager):
+    query = dict(_QUERY, start_date = 'Jan 1 1982', end_date = '1982/01/10')
+    lazy = client.query('planetary-gddp', lazy = True, **query)
+    np.testing.assert_array_equal(lazy.compute(), eager)
+    np.testing.assert_array_equal(lazy.sel_time('Jan 2 1982', 'Jan 3 1982').compute(), eager[1:3])
+
+def test_invalid_indexing(lazy):
+    with pytest.raises(IndexError):
+        lazy[10]
+    with pytest.raises(IndexError):
+        lazy[0, 0, 0, 0]
+    with pytest.raises(IndexError):
+        lazy[::2]
+    with pytest.raises(ValueError):
+        lazy.mean(axis = 0)[0]
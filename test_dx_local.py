@@ -0,0 +1,75 @@
+import asyncio
+import numpy as np
+import pytest
+from dx_interface import AsyncDXInterface, DXInterface
+from dx_local import DXLocalExecutor
+
+def _args(client):
+    return([DXInterface.build_arg(source = 'planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                                  start_date = '1982-01-01', end_date = '1982-01-16',
+                                  geo_lb = (39.0,-76.0), geo_ub = (40.0,-75.0))])
+
+def _query(client):
+    return(client.query('planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                        start_date = '1982-01-01', end_date = '1982-01-16',
+                        geo_lb = (39.0,-76.0), geo_ub = (40.0,-75.0))[0])
+
+@pytest.fixture(params = [False, True], ids = ['threads', 'processes'])
+def client(server, request):
+    with DXInterface(server.socket) as client:
+        client.executor = DXLocalExecutor(client.api, max_workers = 4, processes = request.param)
+        yield client
+
+def _celsius(t):
+    return(t - 273.15)
+
+def _mean_and_max(t):
+    return(t.mean(axis = 0), t.max(axis = 0))
+
+def test_separable_fn_matches_server(client):
+    local = client.exec(_celsius, _args(client))
+    client.executor = None
+    np.testing.assert_allclose(local, client.exec(_celsius, _args(client)))
+
+def test_reduction_runs_whole(client):
+    # Lazy reductions ship a keepdims reducer, which is not separable.
+    lazy = client.query('planetary-gddp', variable = 'tas', model = 'ACCESS-ESM1-5',
+                        start_date = '1982-01-01', end_date = '1982-01-16',
+                        geo_lb = (39.0,-76.0), geo_ub = (40.0,-75.0), lazy = True)
+    np.testing.assert_allclose(lazy.mean(axis = 0).compute(), _query(client).mean(axis = 0), rtol = 1e-6)
+
+def test_tuple_result_runs_whole(client):
+    mean, high = client.exec(_mean_and_max, _args(client))
+    data = _query(client)
+    np.testing.assert_allclose(mean, data.mean(axis = 0), rtol = 1e-6)
+    np.testing.assert_array_equal(high, data.max(axis = 0))
+
+def test_forced_separable_rejects_reductions(client):
+    client.executor.separable = True
+    with pytest.raises(ValueError):
+        client.exec(_mean_and_max, _args(client))
+
+def test_separable_fn_is_split(server):
+    calls = []
+    def fn(t):
+        calls.append(t.shape[0])
+        return(t * 2)
+    with DXInterface(server.socket) as client:
+        client.executor = DXLocalExecutor(client.api, max_workers = 4, processes = False)
+        out = client.exec(fn, _args(client))
+        np.testing.assert_array_equal(out, _query(client) * 2)
+    # Two probe calls, then the chunks, which cover the 16 days.
+    assert calls[:2] == [1, 2] and sum(calls[2:]) == 16 and len(calls) > 3
+
+def test_async_exec_uses_executor(server):
+    class Recorder:
+        def __init__(self):
+            self.calls = 0
+        def exec(self, fn, args):
+            self.calls += 1
+            return(np.zeros(1))
+    async def run():
+        async with AsyncDXInterface(server.socket, executor = Recorder()) as client:
+            await client.exec(_celsius, _args(client))
+            return(client.client.executor.calls)
+    assert asyncio.run(run()) == 1
@@ -0,0 +1,12 @@
+import pytest
+import requests
+from dx_data_api import DXDataAPI
+from dx_mock_server import DXMockServer
+
+def test_stop_closes_pooled_connections(get):
+    server = DXMockServer().start()
+    with DXDataAPI(server.socket, retries = 0) as api:
+        assert get(api).shape == (2, 4, 4)
+        server.stop()
+        with pytest.raises(requests.ConnectionError):
+            get(api)
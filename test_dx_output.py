@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+from dx_output import DXTimeWriter, cast_result, compact, int16_params, pack_int16, write_time_chunks
+
+def test_pack_int16_round_trip():
+    rng = np.random.default_rng(0)
+    arr = rng.uniform(-40.0, 60.0, size=(5, 7, 9))
+    packed = pack_int16(arr)
+    assert packed.data.dtype == np.int16 and packed.shape == arr.shape
+    # Within half a quantization step.
+    np.testing.assert_allclose(packed.unpack(np.float64), arr, rtol=0, atol=packed.scale / 2 + 1e-12)
+
+def test_pack_int16_nan_is_fill():
+    packed = pack_int16(np.array([1.0, np.nan, 5.0]))
+    assert packed.data[1] == packed.fill
+    out = packed.unpack()
+    assert np.isnan(out[1])
+    np.testing.assert_allclose(out[[0, 2]], [1.0, 5.0], atol=packed.scale)
+
+def test_pack_int16_ignores_infinities_when_fitting():
+    packed = pack_int16(np.array([1.0, np.nan, 5.0, np.inf, -np.inf]))
+    assert np.isfinite(packed.scale) and np.isfinite(packed.offset)
+    assert (packed.scale, packed.offset) == int16_params(1.0, 5.0)
+    out = packed.unpack(np.float64)
+    np.testing.assert_allclose(out[[0, 2]], [1.0, 5.0], atol=packed.scale)
+    assert np.isnan(out[1])
+    # Infinities clip to the ends of the fitted range.
+    np.testing.assert_allclose(out[[3, 4]], [5.0, 1.0], atol=packed.scale)
+
+def test_pack_int16_all_missing():
+    packed = pack_int16(np.full(4, np.nan))
+    assert (packed.data == packed.fill).all()
+
+def test_pack_int16_explicit_params_clip():
+    packed = pack_int16(np.array([0.0, 10.0, 1e9]), scale = 0.01, offset = 0.0)
+    np.testing.assert_allclose(packed.unpack(np.float64), [0.0, 10.0, 327.67])
+
+def test_pack_int16_out_must_match():
+    with pytest.raises(ValueError):
+        pack_int16(np.zeros((2, 3)), out = np.empty((3, 2), dtype=np.int16))
+
+def test_compact():
+    arr = np.linspace(0.0, 1.0, 12).reshape(3, 4)
+    assert compact(arr) is arr
+    assert compact(arr, 'float32').dtype == np.float32
+    np.testing.assert_allclose(compact(arr, 'int16').unpack(), arr, atol=1e-4)
+
+def test_cast_result_has_bare_globals():
+    fn = cast_result(np.add, 'float32')
+    assert set(fn.__globals__) == {'__builtins__'}
+    assert fn(np.ones(2), np.ones(2)).dtype == np.float32
+    assert cast_result(np.add, 'float32') is fn
+
+def _series(shape = (10, 3, 4)):
+    return(np.arange(np.prod(shape), dtype=np.float64).reshape(shape) / 7.0)
+
+def test_time_writer_npy(tmp_path):
+    data = _series()
+    path = str(tmp_path / 'out.npy')
+    with DXTimeWriter(path, data.shape) as w:
+        for start in range(0, 10, 4):
+            w.write(start, data[start:start+4])
+    np.testing.assert_allclose(np.load(path), data.astype(np.float32))
+
+def test_time_writer_npy_int16(tmp_path):
+    data = _series()
+    data[2, 1, 1] = np.nan
+    scale, offset = int16_params(np.nanmin(data), np.nanmax(data))
+    path = str(tmp_path / 'out.npy')
+    with DXTimeWriter(path, data.shape, dtype = np.int16, scale = scale, offset = offset) as w:
+        w.write(0, data[:5])
+        w.write(5, data[5:])
+    packed = np.load(path)
+    assert packed.dtype == np.int16
+    ref = pack_int16(data, scale, offset)
+    np.testing.assert_array_equal(packed, ref.data)
+
+def test_time_writer_int16_needs_scale(tmp_path):
+    with pytest.raises(ValueError):
+        DXTimeWriter(str(tmp_path / 'out.npy'), (2, 2), dtype = np.int16)
+
+def test_time_writer_netcdf_int16(tmp_path):
+    nc = pytest.importorskip('netCDF4')
+    data = _series()
+    data[3, 0, 2] = np.nan
+    scale, offset = int16_params(np.nanmin(data), np.nanmax(data))
+    path = str(tmp_path / 'out.nc')
+    days = np.arange('2000-01-01', '2000-01-11', dtype='datetime64[D]')
+    with DXTimeWriter(path, data.shape, dtype = np.int16, scale = scale, offset = offset,
+                      coords = {'time': days}, units = 'K') as w:
+        for start in range(0, 10, 3):
+            w.write(start, data[start:start+3])
+    with nc.Dataset(path) as ds:
+        var = ds.variables['data']
+        assert var.dtype == np.int16 and var.units == 'K'
+        out = var[:]
+        assert out.mask[3, 0, 2] and out.mask.sum() == 1
+        np.testing.assert_allclose(out.filled(np.nan), data, atol=scale)
+        np.testing.assert_array_equal(ds.variables['time'][:], days.astype(np.int64))
+
+def test_write_time_chunks(tmp_path):
+    a = _series()
+    field = np.full((3, 4), 2.0)
+    calls = []
+    def fn(x, y):
+        calls.append(x.shape[0])
+        return(x * y)
+    path = write_time_chunks(fn, [a, field], str(tmp_path / 'out.npy'), chunk = 4)
+    assert calls == [4, 4, 2]
+    np.testing.assert_allclose(np.load(path), (a * field).astype(np.float32))
+
+def test_write_time_chunks_reads_memmap_inputs(tmp_path):
+    src = str(tmp_path / 'in.npy')
+    np.save(src, _series())
+    arr = np.load(src, mmap_mode='r')
+    path = write_time_chunks(lambda x: x.mean(axis=(1, 2)), [arr], str(tmp_path / 'out.npy'),
+                             chunk = 3, dtype = np.float64)
+    np.testing.assert_allclose(np.load(path), _series().mean(axis=(1, 2)))
@@ -0,0 +1,294 @@
+import tracemalloc
+import numpy as np
+import pytest
+import wet_bulb
+from wet_bulb import BilinearRegridder, WetBulbArrays, _wet_bulb_cell, regridder, wet_bulb_ufunc
+
+# The scalar implementation WetBulbArrays replaced, applied per cell with
+# np.vectorize. Kept verbatim apart from the wrapper so the vectorized
+# regime masks can be checked against it.
+def _reference(t, p, h):
+    SHR_CONST_TKFRZ = 273.15
+    lambd_a = 3.504     # Inverse of Heat Capacity
+    alpha = 17.67 	    # Constant to calculate vapour pressure
+    beta = 243.5		# Constant to calculate vapour pressure
+    epsilon = 0.6220	# Conversion between pressure/mixing ratio
+    es_C = 611.2		# Vapour Pressure at Freezing STD (Pa)
+    y0 = 3036		    # constant
+    y1 = 1.78		    # constant
+    y2 = 0.448		    # constant
+    Cf = SHR_CONST_TKFRZ	# Freezing Temp (K)
+    p0 = 100000	    # Reference Pressure (Pa)
+    constA = 2675 	 # Constant used for extreme cold temperatures (K)
+    vkp = 0.2854	 # Heat Capacity
+
+    def QSat_2(T_k, p_t, p0ndplam):
+        # Constants used to calculate es(T)
+        # Clausius-Clapeyron
+        tcfbdiff = T_k - Cf + beta
+        es = es_C * np.exp(alpha*(T_k - Cf)/(tcfbdiff))
+        dlnes_dT = alpha * beta/((tcfbdiff)*(tcfbdiff))
+        pminuse = p_t - es
+        de_dT = es * dlnes_dT
+
+        # Constants used to calculate rs(T)
+        rs = epsilon * es/(p0ndplam - es + np.spacing(1)) #eps
+
+        # avoid bad numbers
+        if rs > 1 or rs < 0:
+            rs = np.nan
+
+        return es,rs,dlnes_dT
+
+    def DJ(T_k, p_t, p0ndplam):
+        # Constants used to calculate es(T)
+        # Clausius-Clapeyron
+        tcfbdiff = T_k - Cf + beta
+        es = es_C * np.exp(alpha*(T_k - Cf)/(tcfbdiff))
+        dlnes_dT = alpha * beta/((tcfbdiff)*(tcfbdiff))
+        pminuse = p_t - es
+        de_dT = es * dlnes_dT
+
+        # Constants used to calculate rs(T)
+        rs = epsilon * es/(p0ndplam - es + np.spacing(1)) #eps)
+        prersdt = epsilon * p_t/((pminuse)*(pminuse))
+        rsdT = prersdt * de_dT
+
+        # Constants used to calculate g(T)
+        rsy2rs2 = rs + y2*rs*rs
+        oty2rs = 1 + 2.0*y2*rs
+        y0tky1 = y0/T_k - y1
+        goftk = y0tky1 * (rs + y2 * rs * rs)
+        gdT = - y0 * (rsy2rs2)/(T_k*T_k) + (y0tky1)*(oty2rs)*rsdT
+
+        # Calculations used to calculate f(T,ndimpress)
+        foftk = ((Cf/T_k)**lambd_a)*(1 - es/p0ndplam)**(vkp*lambd_a)*         np.exp(-lambd_a*goftk)
+        fdT = -lambd_a*(1.0/T_k + vkp*de_dT/pminuse + gdT) * foftk
+
+        return foftk,fdT
+
+    def WetBulb(TemperatureK,Pressure,Humidity):
+        HumidityMode = 0
+
+        pnd = (Pressure/p0)**(vkp)
+        p0ndplam = p0*pnd**lambd_a
+
+        C = SHR_CONST_TKFRZ;		# Freezing Temperature
+        T1 = TemperatureK;		# Use holder for T
+
+        if T1 > 10e6 or Humidity > 10e6:
+            return np.nan
+
+        es, rs, _ = QSat_2(TemperatureK, Pressure, p0ndplam) # first two returned values
+
+        if HumidityMode==0:
+            qin = Humidity                   # specific humidity
+            relhum = 100.0 * qin/rs          # relative humidity (%)
+            vape = es * relhum * 0.01   # vapor pressure (Pa)
+        elif HumidityMode==1:
+            relhum = Humidity                # relative humidity (%)
+            qin = rs * relhum * 0.01         # specific humidity
+            vape = es * relhum * 0.01   # vapor pressure (Pa)
+
+        mixr = qin * 1000          # change specific humidity to mixing ratio (g/kg)
+
+        # Calculate Equivalent Pot. Temp (Pressure, T, mixing ratio (g/kg), pott, epott)
+        # Calculate Parameters for Wet Bulb Temp (epott, Pressure)
+        D = 1.0/(0.1859*Pressure/p0 + 0.6512)
+        k1 = -38.5*pnd*pnd + 137.81*pnd - 53.737
+        k2 = -4.392*pnd*pnd + 56.831*pnd - 0.384
+
+        # Calculate lifting condensation level
+        tl = (1.0/((1.0/((T1 - 55))) - (np.log(relhum/100.0)/2840.0))) + 55.0
+
+        # Theta_DL: Bolton 1980 Eqn 24.
+        theta_dl = T1*((p0/(Pressure-vape))**vkp) * ((T1/tl)**(mixr*0.00028))
+        # EPT: Bolton 1980 Eqn 39.
+        epott = theta_dl * np.exp(((3.036/tl)-0.00178)*mixr*(1 + 0.000448*mixr))
+        Teq = epott*pnd	# Equivalent Temperature at pressure
+        X = (C/Teq)**3.504
+
+        # Calculates the regime requirements of wet bulb equations.
+        invalid = Teq > 600 or Teq < 200
+        hot = Teq > 355.15
+        cold = X>=1 and X<=D
+        if invalid:
+            return np.nan
+
+        # Calculate Wet Bulb Temperature, initial guess
+        # Extremely cold regimes: if X.gt.D, then need to calculate dlnesTeqdTeq
+
+        es_teq, rs_teq, dlnes_dTeq = QSat_2(Teq, Pressure, p0ndplam)
+        if X<=D:
+            wb_temp = C + (k1 - 1.21 * cold - 1.45 * hot - (k2 - 1.21 * cold) * X + (0.58 / X) * hot)
+        else:
+            wb_temp = Teq - ((constA*rs_teq)/(1 + (constA*rs_teq*dlnes_dTeq)))
+
+        # Newton-Raphson Method
+        maxiter = 2
+        iter = 0
+        delta = 1e6
+
+        while delta>0.01 and iter<maxiter:
+            foftk_wb_temp, fdwb_temp = DJ(wb_temp, Pressure, p0ndplam)
+            delta = (foftk_wb_temp - X)/fdwb_temp  #float((foftk_wb_temp - X)/fdwb_temp)
+            delta = np.minimum(10,delta)
+            delta = np.maximum(-10,delta) #max(-10,delta)
+            wb_temp = wb_temp - delta
+            Twb = wb_temp
+            iter = iter+1
+
+        return Twb-C
+
+    return(np.vectorize(WetBulb)(t, p, h))
+
+def _inputs(shape, seed = 0):
+    # Random cells plus a few fixed ones in each regime: missing values, the
+    # >10e6 guard, hot (Teq > 355.15), extreme cold (X > D) and invalid Teq.
+    rng = np.random.default_rng(seed)
+    t = rng.uniform(230.0, 320.0, shape)
+    h = rng.uniform(0.0, 0.03, shape)
+    p = rng.uniform(50000.0, 104000.0, shape[-2:])
+    flat_t = t.reshape(-1, shape[-1])
+    flat_h = h.reshape(-1, shape[-1])
+    cases = [(np.nan, 0.01), (300.0, np.nan), (2e7, 0.01), (300.0, 2e7),
+             (318.0, 0.045), (325.0, 0.05), (200.0, 1e-5), (190.0, 1e-6), (450.0, 0.3)]
+    for i, (tc, hc) in enumerate(cases):
+        flat_t[i % flat_t.shape[0], i] = tc
+        flat_h[i % flat_h.shape[0], i] = hc
+    return(t, p, h)
+
+@pytest.mark.parametrize('shape', [(16, 24), (3, 16, 24)])
+def test_wet_bulb_arrays_parity(shape):
+    t, p, h = _inputs(shape)
+    with np.errstate(all = 'ignore'):
+        ref = _reference(t, p, h)
+        out = WetBulbArrays(t, p, h)
+    assert out.shape == ref.shape
+    np.testing.assert_array_equal(np.isnan(out), np.isnan(ref))
+    np.testing.assert_allclose(out, ref, rtol = 0, atol = 1e-9, equal_nan = True)
+
+def _peak_bytes(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return(result, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+
+def test_wet_bulb_arrays_blocks(monkeypatch):
+    # Blocked evaluation matches a single pass and its temporaries stay
+    # bounded by the block size rather than growing with the time axis.
+    t, p, h = _inputs((32, 64, 64))
+    monkeypatch.setattr(wet_bulb, '_BLOCK_CELLS', 2**30)
+    whole, whole_peak = _peak_bytes(lambda: WetBulbArrays(t, p, h))
+    monkeypatch.setattr(wet_bulb, '_BLOCK_CELLS', 64 * 64)
+    blocked, blocked_peak = _peak_bytes(lambda: WetBulbArrays(t, p, h))
+    np.testing.assert_array_equal(blocked, whole)
+    assert blocked_peak < whole_peak / 4
+    assert blocked_peak < 3 * t.nbytes
+
+def test_wet_bulb_arrays_dtypes():
+    t, p, h = _inputs((2, 16, 24))
+    out = WetBulbArrays(t.astype(np.float32), p.astype(np.float32), h.astype(np.float32))
+    assert out.dtype == np.float32
+    assert WetBulbArrays(300.0, 101325.0, 0.01).shape == ()
+
+def test_wet_bulb_regimes_covered():
+    # Guards against _inputs drifting away from the branches it is meant
+    # to exercise.
+    t, p, h = _inputs((16, 24))
+    pnd = (p / 100000) ** 0.2854
+    D = 1.0 / (0.1859 * p / 100000 + 0.6512)
+    with np.errstate(all = 'ignore'):
+        ref = _reference(t, p, h)
+        es = 611.2 * np.exp(17.67 * (t - 273.15) / (t - 273.15 + 243.5))
+        rs = 0.622 * es / (100000 * pnd ** 3.504 - es + np.spacing(1))
+        relhum = 100.0 * h / rs
+        vape = es * relhum * 0.01
+        mixr = h * 1000
+        tl = 1.0 / (1.0 / (t - 55) - np.log(relhum / 100.0) / 2840.0) + 55.0
+        epott = (t * (100000 / (p - vape)) ** 0.2854 * (t / tl) ** (mixr * 0.00028)
+                 * np.exp((3.036 / tl - 0.00178) * mixr * (1 + 0.000448 * mixr)))
+        teq = epott * pnd
+        X = (273.15 / teq) ** 3.504
+    valid = (teq >= 200) & (teq <= 600)
+    assert np.isnan(ref).any()
+    assert ((t > 10e6) | (h > 10e6)).any()
+    assert (valid & (teq > 355.15) & np.isfinite(ref)).any()
+    assert (valid & (X > D) & np.isfinite(ref)).any()
+
+def test_wet_bulb_ufunc_matches_arrays():
+    t, p, h = _inputs((3, 16, 24), seed = 1)
+    with np.errstate(all = 'ignore'):
+        ref = WetBulbArrays(t, p, h)
+    out = wet_bulb_ufunc(t, p, h)
+    np.testing.assert_allclose(out, ref, rtol = 1e-6, atol = 1e-6, equal_nan = True)
+
+def test_wet_bulb_cell_parity():
+    # The per-cell kernel the compiled ufunc is built from, run in Python.
+    t, p, h = _inputs((16, 24), seed = 2)
+    with np.errstate(all = 'ignore'):
+        ref = _reference(t, p, h)
+        out = np.vectorize(_wet_bulb_cell, otypes = [np.float64])(t, p, h)
+    np.testing.assert_array_equal(np.isnan(out), np.isnan(ref))
+    np.testing.assert_allclose(out, ref, rtol = 0, atol = 1e-9, equal_nan = True)
+
+def test_wet_bulb_ufunc_compiled(monkeypatch):
+    pytest.importorskip('numba')
+    monkeypatch.setattr(wet_bulb, '_compiled_ufunc', None)
+    assert wet_bulb._get_compiled_ufunc() is not None
+    t, p, h = _inputs((3, 16, 24), seed = 3)
+    with np.errstate(all = 'ignore'):
+        ref = _reference(t, p, h)
+    out = wet_bulb_ufunc(t, p, h)
+    assert out.dtype == np.float64
+    np.testing.assert_allclose(out, ref, rtol = 0, atol = 1e-9, equal_nan = True)
+    out32 = np.empty(t.shape, dtype = np.float32)
+    assert wet_bulb_ufunc(t.astype(np.float32), p.astype(np.float32), h.astype(np.float32), out = out32) is out32
+    np.testing.assert_array_equal(np.isnan(out32), np.isnan(ref))
+    np.testing.assert_allclose(out32, ref, rtol = 0, atol = 1e-2, equal_nan = True)
+
+def _bilinear_field(lat, lon):
+    # Bilinear in (lat, lon), so interpolation (and the linear extrapolation
+    # past the edges) reproduces it exactly.
+    lat, lon = np.meshgrid(lat, lon, indexing = 'ij')
+    return(3.0 + 0.5 * lat - 0.25 * lon + 0.01 * lat * lon)
+
+def _grids():
+    rng = np.random.default_rng(4)
+    # Irregular source spacing; the target reaches past the source edges.
+    src_lat = np.sort(rng.uniform(-10.0, 10.0, 15))
+    src_lon = np.sort(rng.uniform(100.0, 130.0, 21))
+    dst_lat = np.linspace(-12.0, 12.0, 31)
+    dst_lon = np.linspace(98.0, 132.0, 45)
+    return(src_lat, src_lon, dst_lat, dst_lon)
+
+def test_regridder_reproduces_bilinear_field():
+    src_lat, src_lon, dst_lat, dst_lon = _grids()
+    rg = BilinearRegridder(src_lat, src_lon, dst_lat, dst_lon)
+    assert rg.shape == (31, 45)
+    src = _bilinear_field(src_lat, src_lon)
+    expected = _bilinear_field(dst_lat, dst_lon)
+    np.testing.assert_allclose(rg(src), expected, rtol = 1e-12, atol = 1e-10)
+    window = rg(src, rows = slice(5, 12), cols = slice(30, 40))
+    np.testing.assert_allclose(window, expected[5:12, 30:40], rtol = 1e-12, atol = 1e-10)
+    out32 = rg(src.astype(np.float32), dtype = np.float32)
+    assert out32.dtype == np.float32
+    np.testing.assert_allclose(out32, expected, rtol = 1e-5, atol = 1e-4)
+    with pytest.raises(ValueError):
+        rg(src[1:])
+
+def test_regridder_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(wet_bulb, '_regridders', {})
+    grids = _grids()
+    rg = regridder(*grids, cache_dir = str(tmp_path))
+    assert regridder(*grids, cache_dir = str(tmp_path)) is rg
+    (saved,) = tmp_path.iterdir()
+    assert saved.name.startswith('regrid-') and saved.suffix == '.npz'
+    # A new process loads the saved weights instead of rebuilding them.
+    monkeypatch.setattr(wet_bulb, '_regridders', {})
+    loaded = regridder(*grids, cache_dir = str(tmp_path))
+    assert loaded is not rg
+    src = _bilinear_field(grids[0], grids[1])
+    np.testing.assert_array_equal(loaded(src), rg(src))
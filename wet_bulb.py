@@ -1,3 +1,6 @@
+import hashlib
+import math
+import os
 import numpy as np
 
 def pressurefromelev(elev):
@@ -12,7 +15,91 @@ def pressurefromelev(elev):
     pressure=100*np.round(1010*((Tbase+L*10**-3*elev)/Tbase)**((G*M)/(R*L)),2);
     return pressure
 
+def _axis_weights(src, dst):
+    # Same cell search as RegularGridInterpolator: points outside the source
+    # axis use the edge cell, i.e. they are linearly extrapolated.
+    src = np.asarray(src, dtype=np.float64)
+    dst = np.asarray(dst, dtype=np.float64)
+    idx = np.clip(np.searchsorted(src, dst) - 1, 0, len(src) - 2)
+    w = (dst - src[idx]) / (src[idx + 1] - src[idx])
+    return(idx, w)
+
+class BilinearRegridder:
+    # Bilinear interpolation between two regular (lat, lon) grids, equivalent
+    # to RegularGridInterpolator(..., bounds_error=False, fill_value=None) on
+    # the meshgrid of the target axes. The operator is separable, so only the
+    # source index and weight per target row and column are kept; applying it
+    # is a blend of two source rows followed by a blend of two columns.
+    def __init__(self, src_lat, src_lon, dst_lat, dst_lon):
+        self.src_shape = (len(src_lat), len(src_lon))
+        self.lat_idx, self.lat_w = _axis_weights(src_lat, dst_lat)
+        self.lon_idx, self.lon_w = _axis_weights(src_lon, dst_lon)
+
+    @property
+    def shape(self):
+        return((len(self.lat_idx), len(self.lon_idx)))
+
+    def save(self, path):
+        np.savez(path, src_shape=np.array(self.src_shape), lat_idx=self.lat_idx, lat_w=self.lat_w,
+                 lon_idx=self.lon_idx, lon_w=self.lon_w)
+
+    @classmethod
+    def load(cls, path):
+        self = cls.__new__(cls)
+        with np.load(path) as f:
+            self.src_shape = tuple(int(x) for x in f['src_shape'])
+            self.lat_idx, self.lat_w = f['lat_idx'], f['lat_w']
+            self.lon_idx, self.lon_w = f['lon_idx'], f['lon_w']
+        return(self)
+
+    def __call__(self, src, rows = None, cols = None, dtype = np.float64):
+        # rows and cols are slices of the target grid, so a regional window
+        # only touches the source rows and columns it needs.
+        src = np.ma.getdata(src)
+        if src.shape != self.src_shape:
+            raise ValueError(f'source field has shape {src.shape}, expected {self.src_shape}.')
+        rows = rows if rows is not None else slice(None)
+        cols = cols if cols is not None else slice(None)
+        ilat, wlat = self.lat_idx[rows], self.lat_w[rows].astype(dtype)[:, None]
+        ilon, wlon = self.lon_idx[cols], self.lon_w[cols].astype(dtype)
+        j0 = ilon.min()
+        sub = src[:, j0:ilon.max() + 2]
+        lo = sub[ilat].astype(dtype)
+        blended = lo + (sub[ilat + 1].astype(dtype) - lo) * wlat
+        lo = blended[:, ilon - j0]
+        return(lo + (blended[:, ilon - j0 + 1] - lo) * wlon)
+
+_regridders = {}
+
+def regridder(src_lat, src_lon, dst_lat, dst_lon, cache_dir = None):
+    # Returns the BilinearRegridder for a grid pair, built once per process
+    # and, when cache_dir is given, loaded from or saved to disk.
+    axes = [np.ascontiguousarray(a, dtype=np.float64) for a in (src_lat, src_lon, dst_lat, dst_lon)]
+    h = hashlib.sha1()
+    for a in axes:
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    key = h.hexdigest()
+    if key in _regridders:
+        return(_regridders[key])
+    path = os.path.join(cache_dir, f'regrid-{key}.npz') if cache_dir else None
+    if path and os.path.exists(path):
+        rg = BilinearRegridder.load(path)
+    else:
+        rg = BilinearRegridder(*axes)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.tmp.npz'
+            rg.save(tmp)
+            os.replace(tmp, path)
+    _regridders[key] = rg
+    return(rg)
+
+# Cells per block in WetBulbArrays; peak memory is a few hundred bytes per cell.
+_BLOCK_CELLS = 2**18
+
 def WetBulbArrays(t, p, h):
+    import numpy as np
     SHR_CONST_TKFRZ = 273.15
     lambd_a = 3.504     # Inverse of Heat Capacity
     alpha = 17.67 	    # Constant to calculate vapour pressure
@@ -27,21 +114,20 @@ def WetBulbArrays(t, p, h):
     constA = 2675 	 # Constant used for extreme cold temperatures (K)
     vkp = 0.2854	 # Heat Capacity
 
+    # All helpers below operate elementwise on broadcast arrays; the scalar
+    # branches of the original per-cell kernel are expressed as masks.
     def QSat_2(T_k, p_t, p0ndplam):
         # Constants used to calculate es(T)
         # Clausius-Clapeyron
         tcfbdiff = T_k - Cf + beta
         es = es_C * np.exp(alpha*(T_k - Cf)/(tcfbdiff))
         dlnes_dT = alpha * beta/((tcfbdiff)*(tcfbdiff))
-        pminuse = p_t - es
-        de_dT = es * dlnes_dT
 
         # Constants used to calculate rs(T)
         rs = epsilon * es/(p0ndplam - es + np.spacing(1)) #eps
 
         # avoid bad numbers
-        if rs > 1 or rs < 0:
-            rs = np.nan
+        rs = np.where((rs > 1) | (rs < 0), np.nan, rs)
 
         return es,rs,dlnes_dT
 
@@ -73,27 +159,17 @@ def WetBulbArrays(t, p, h):
         return foftk,fdT
 
     def WetBulb(TemperatureK,Pressure,Humidity):
-        HumidityMode = 0
-
         pnd = (Pressure/p0)**(vkp)
         p0ndplam = p0*pnd**lambd_a
 
         C = SHR_CONST_TKFRZ;		# Freezing Temperature
         T1 = TemperatureK;		# Use holder for T
 
-        if T1 > 10e6 or Humidity > 10e6:
-            return np.nan
-
         es, rs, _ = QSat_2(TemperatureK, Pressure, p0ndplam) # first two returned values
 
-        if HumidityMode==0:
-            qin = Humidity                   # specific humidity
-            relhum = 100.0 * qin/rs          # relative humidity (%)
-            vape = es * relhum * 0.01   # vapor pressure (Pa)
-        elif HumidityMode==1:
-            relhum = Humidity                # relative humidity (%)
-            qin = rs * relhum * 0.01         # specific humidity
-            vape = es * relhum * 0.01   # vapor pressure (Pa)
+        qin = Humidity                   # specific humidity
+        relhum = 100.0 * qin/rs          # relative humidity (%)
+        vape = es * relhum * 0.01   # vapor pressure (Pa)
 
         mixr = qin * 1000          # change specific humidity to mixing ratio (g/kg)
 
@@ -114,45 +190,167 @@ def WetBulbArrays(t, p, h):
         X = (C/Teq)**3.504
 
         # Calculates the regime requirements of wet bulb equations.
-        invalid = Teq > 600 or Teq < 200
+        invalid = (Teq > 600) | (Teq < 200) | (T1 > 10e6) | (Humidity > 10e6)
         hot = Teq > 355.15
-        cold = X>=1 and X<=D
-        if invalid:
-            return np.nan
+        cold = (X >= 1) & (X <= D)
 
         # Calculate Wet Bulb Temperature, initial guess
         # Extremely cold regimes: if X.gt.D, then need to calculate dlnesTeqdTeq
-
         es_teq, rs_teq, dlnes_dTeq = QSat_2(Teq, Pressure, p0ndplam)
-        if X<=D:
-            wb_temp = C + (k1 - 1.21 * cold - 1.45 * hot - (k2 - 1.21 * cold) * X + (0.58 / X) * hot)
-        else:
-            wb_temp = Teq - ((constA*rs_teq)/(1 + (constA*rs_teq*dlnes_dTeq)))
+        wb_temp = np.where(X <= D,
+            C + (k1 - 1.21 * cold - 1.45 * hot - (k2 - 1.21 * cold) * X + (0.58 / X) * hot),
+            Teq - ((constA*rs_teq)/(1 + (constA*rs_teq*dlnes_dTeq))))
 
-        # Newton-Raphson Method
+        # Newton-Raphson Method, a fixed two iterations. A cell only takes
+        # the second step while its first correction is still above tolerance.
         maxiter = 2
-        iter = 0
-        delta = 1e6
-
-        while delta>0.01 and iter<maxiter:
+        active = np.ones(wb_temp.shape, dtype=bool)
+        for iter in range(maxiter):
             foftk_wb_temp, fdwb_temp = DJ(wb_temp, Pressure, p0ndplam)
-            delta = (foftk_wb_temp - X)/fdwb_temp  #float((foftk_wb_temp - X)/fdwb_temp)
+            delta = (foftk_wb_temp - X)/fdwb_temp
             delta = np.minimum(10,delta)
-            delta = np.maximum(-10,delta) #max(-10,delta)
-            wb_temp = wb_temp - delta
-            Twb = wb_temp
-            iter = iter+1
+            delta = np.maximum(-10,delta)
+            wb_temp = np.where(active, wb_temp - delta, wb_temp)
+            active &= delta > 0.01
 
-        return Twb-C
+        Twb = np.where(invalid, np.nan, wb_temp - C)
+        return Twb
 
-    import numpy as np
-    vWetBulb = np.vectorize(WetBulb)
-    result = np.empty_like(t)
-    if len(result.shape) > 2:
-        for d in range(result.shape[0]):
-            res_slice = vWetBulb(t[d], p, h[d])
-            print(res_slice.shape)
-            result[d] = vWetBulb(t[d], p, h[d])
-    else:
-        result = vWetBulb(t, p, h)
+    # p is typically (lat, lon) while t and h are (time, lat, lon); regular
+    # broadcasting stretches it across the time axis without a copy. The
+    # kernel's temporaries are many times the size of its input, so it runs
+    # over blocks of about _BLOCK_CELLS cells along the leading axis.
+    t, p, h = np.broadcast_arrays(np.asarray(t), np.asarray(p), np.asarray(h))
+    out_dtype = t.dtype if t.dtype.kind == 'f' else np.float64
+    result = np.empty(t.shape, dtype=out_dtype)
+    with np.errstate(all='ignore'):
+        if result.ndim == 0:
+            result[...] = WetBulb(float(t), float(p), float(h))
+            return(result)
+        step = max(1, _BLOCK_CELLS // max(1, int(np.prod(t.shape[1:]))))
+        for i in range(0, t.shape[0], step):
+            block = slice(i, i + step)
+            result[block] = WetBulb(t[block].astype(np.float64), p[block].astype(np.float64),
+                                    h[block].astype(np.float64))
     return(result)
+
+def _wet_bulb_cell(TemperatureK, Pressure, Humidity):
+    # Per-cell form of WetBulbArrays for the compiled ufunc. es(T) and its
+    # derivatives are evaluated once per temperature and shared between the
+    # QSat and DJ terms instead of being recomputed by each helper.
+    C = 273.15          # Freezing Temp (K)
+    lambd_a = 3.504     # Inverse of Heat Capacity
+    alpha = 17.67       # Constant to calculate vapour pressure
+    beta = 243.5        # Constant to calculate vapour pressure
+    epsilon = 0.6220    # Conversion between pressure/mixing ratio
+    es_C = 611.2        # Vapour Pressure at Freezing STD (Pa)
+    y0 = 3036.0         # constant
+    y1 = 1.78           # constant
+    y2 = 0.448          # constant
+    p0 = 100000.0       # Reference Pressure (Pa)
+    constA = 2675.0     # Constant used for extreme cold temperatures (K)
+    vkp = 0.2854        # Heat Capacity
+    eps = 2.220446049250313e-16
+    nan = math.nan
+
+    # NumPy scalars rather than Python floats, so that run uncompiled (e.g.
+    # through np.vectorize) invalid cells give NaN as they do under numba
+    # instead of raising from math.log or a division by zero.
+    T1 = np.float64(TemperatureK)
+    Pressure = np.float64(Pressure)
+    qin = np.float64(Humidity)
+    # Powers are taken as exp/log of shared logarithms, which roughly halves
+    # the transcendental calls that dominate the per-cell cost.
+    lnp = np.log(Pressure/p0)
+    pnd = np.exp(vkp*lnp)
+    p0ndplam = p0*np.exp(vkp*lambd_a*lnp)
+
+    tcfbdiff = T1 - C + beta
+    es = es_C * np.exp(alpha*(T1 - C)/tcfbdiff)
+    rs = epsilon * es/(p0ndplam - es + eps)
+    if rs > 1 or rs < 0:
+        rs = nan
+    relhum = 100.0 * qin/rs
+    vape = es * relhum * 0.01
+    mixr = qin * 1000
+
+    D = 1.0/(0.1859*Pressure/p0 + 0.6512)
+    k1 = -38.5*pnd*pnd + 137.81*pnd - 53.737
+    k2 = -4.392*pnd*pnd + 56.831*pnd - 0.384
+
+    tl = (1.0/((1.0/((T1 - 55))) - (np.log(relhum/100.0)/2840.0))) + 55.0
+    epott = T1 * np.exp(vkp*np.log(p0/(Pressure-vape)) + mixr*0.00028*np.log(T1/tl)
+                          + ((3.036/tl)-0.00178)*mixr*(1 + 0.000448*mixr))
+    Teq = epott*pnd
+    X = (C/Teq)**3.504
+
+    if Teq > 600 or Teq < 200 or T1 > 10e6 or qin > 10e6:
+        return(nan)
+    if X <= D:
+        hot = 1.0 if Teq > 355.15 else 0.0
+        cold = 1.0 if X >= 1 else 0.0
+        wb_temp = C + (k1 - 1.21 * cold - 1.45 * hot - (k2 - 1.21 * cold) * X + (0.58 / X) * hot)
+    else:
+        tcfbdiff = Teq - C + beta
+        es_teq = es_C * np.exp(alpha*(Teq - C)/tcfbdiff)
+        dlnes_dTeq = alpha * beta/(tcfbdiff*tcfbdiff)
+        rs_teq = epsilon * es_teq/(p0ndplam - es_teq + eps)
+        if rs_teq > 1 or rs_teq < 0:
+            rs_teq = nan
+        wb_temp = Teq - ((constA*rs_teq)/(1 + (constA*rs_teq*dlnes_dTeq)))
+
+    for iter in range(2):
+        tcfbdiff = wb_temp - C + beta
+        es = es_C * np.exp(alpha*(wb_temp - C)/tcfbdiff)
+        dlnes_dT = alpha * beta/(tcfbdiff*tcfbdiff)
+        pminuse = Pressure - es
+        de_dT = es * dlnes_dT
+        rs = epsilon * es/(p0ndplam - es + eps)
+        rsdT = epsilon * Pressure/(pminuse*pminuse) * de_dT
+        y0tky1 = y0/wb_temp - y1
+        rsy2rs2 = rs + y2*rs*rs
+        goftk = y0tky1 * rsy2rs2
+        gdT = - y0 * rsy2rs2/(wb_temp*wb_temp) + y0tky1*(1 + 2.0*y2*rs)*rsdT
+        foftk = np.exp(lambd_a*(np.log(C/wb_temp) + vkp*np.log(1 - es/p0ndplam) - goftk))
+        fdT = -lambd_a*(1.0/wb_temp + vkp*de_dT/pminuse + gdT) * foftk
+        delta = (foftk - X)/fdT
+        # Written out so a NaN delta propagates like np.minimum/np.maximum.
+        if delta > 10:
+            delta = 10.0
+        elif delta < -10:
+            delta = -10.0
+        wb_temp = wb_temp - delta
+        if not delta > 0.01:
+            break
+    return(wb_temp - C)
+
+_compiled_ufunc = None
+
+def _get_compiled_ufunc():
+    global _compiled_ufunc
+    if _compiled_ufunc is None:
+        try:
+            import numba
+        except ImportError:
+            _compiled_ufunc = False
+            return(None)
+        # A real NumPy ufunc: NumPy drives the loop (broadcasting, out=,
+        # casting) and releases the GIL around it for these float types.
+        _compiled_ufunc = numba.vectorize(['float32(float32, float32, float32)', 'float64(float64, float64, float64)'],
+                                          nopython=True, cache=True)(_wet_bulb_cell)
+    return(_compiled_ufunc or None)
+
+def wet_bulb_ufunc(t, p, h, out = None):
+    # Compiled wet bulb temperature (C) when numba is installed; the first
+    # call compiles the kernel, or loads it from numba's on-disk cache.
+    # Without numba this falls back to WetBulbArrays. Float32 inputs give a
+    # float32 result without any full-size float64 temporaries.
+    ufunc = _get_compiled_ufunc()
+    if ufunc is not None:
+        with np.errstate(all='ignore'):
+            return(ufunc(t, p, h, out=out))
+    result = WetBulbArrays(t, p, h)
+    if out is None:
+        return(result)
+    out[...] = result
+    return(out)